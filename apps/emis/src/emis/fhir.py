@@ -0,0 +1,184 @@
+"""FHIR R4 views of the shared EPR data store.
+
+Records are mapped to FHIR resources on demand and the serialized JSON of
+each resource is cached against the record's version, so a resource is only
+serialized again after it changes.
+"""
+
+import json
+from datetime import datetime
+from typing import Callable, Optional
+
+NHS_NUMBER_SYSTEM = "https://fhir.nhs.uk/Id/nhs-number"
+
+_GENDERS = {"M": "male", "F": "female", "U": "unknown"}
+_APPOINTMENT_STATUSES = {
+    "SCHEDULED": "booked",
+    "CONFIRMED": "booked",
+    "CANCELLED": "cancelled",
+    "COMPLETED": "fulfilled",
+    "NO_SHOW": "noshow",
+}
+_OBSERVATION_STATUSES = {
+    "DRAFT": "preliminary",
+    "FINAL": "final",
+    "SENT": "final",
+    "ARCHIVED": "final",
+}
+
+_encoder = json.JSONEncoder(
+    separators=(",", ":"), ensure_ascii=False, check_circular=False
+)
+
+
+def dumps(value: object) -> bytes:
+    """Serialize a JSON value to compact UTF-8 bytes."""
+    return _encoder.encode(value).encode("utf-8")
+
+
+def _instant(local_time: str) -> str:
+    """Convert a naive local ISO timestamp into a FHIR instant."""
+    return datetime.fromisoformat(local_time).astimezone().isoformat()
+
+
+def fhir_gender(patient: dict) -> str:
+    """Return the FHIR gender code of a patient record."""
+    return _GENDERS.get(patient["gender"], "unknown")
+
+
+def appointment_status(appointment: dict) -> str:
+    """Return the FHIR status code of an appointment record."""
+    return _APPOINTMENT_STATUSES.get(appointment["status"], "proposed")
+
+
+def _address(address: object) -> Optional[dict]:
+    """Map a structured patient address, or return None if it is not one."""
+    if not isinstance(address, dict):
+        return None
+    resource = {
+        "use": "home",
+        "line": [line for line in (address.get("line1"), address.get("line2")) if line],
+        "city": address.get("city"),
+        "postalCode": address.get("postcode"),
+    }
+    # FHIR JSON does not allow empty arrays or nulls
+    return {key: value for key, value in resource.items() if value}
+
+
+def patient_resource(patient: dict) -> dict:
+    """Map a patient record to a FHIR Patient resource."""
+    resource = {
+        "resourceType": "Patient",
+        "id": patient["patient_id"],
+        "meta": {"versionId": str(patient["version"])},
+        "identifier": [{"system": NHS_NUMBER_SYSTEM, "value": patient["nhs_number"]}],
+        "name": [
+            {
+                "use": "official",
+                "family": patient["last_name"],
+                "given": [patient["first_name"]],
+            }
+        ],
+        "gender": fhir_gender(patient),
+        "birthDate": patient["date_of_birth"],
+        "telecom": [
+            {"system": "phone", "value": patient["phone"], "use": "home"},
+            {"system": "email", "value": patient["email"]},
+        ],
+    }
+    address = _address(patient.get("address"))
+    if address is not None:
+        resource["address"] = [address]
+    return resource
+
+
+def appointment_resource(appointment: dict) -> dict:
+    """Map an appointment record to a FHIR Appointment resource."""
+    return {
+        "resourceType": "Appointment",
+        "id": appointment["appointment_id"],
+        "meta": {"versionId": str(appointment["version"])},
+        "status": appointment_status(appointment),
+        "appointmentType": {"text": appointment["appointment_type"]},
+        "description": appointment["notes"],
+        "start": _instant(appointment["scheduled_time"]),
+        "minutesDuration": appointment["duration_minutes"],
+        "participant": [
+            {
+                "actor": {"reference": f"Patient/{appointment['patient_id']}"},
+                "status": "accepted",
+            },
+            {
+                "actor": {"reference": f"Practitioner/{appointment['clinician_id']}"},
+                "status": "accepted",
+            },
+            {
+                "actor": {"display": appointment["location"]},
+                "status": "accepted",
+            },
+        ],
+    }
+
+
+def is_observation(document: dict) -> bool:
+    """Whether a document is exposed as an Observation (lab results only)."""
+    return document["document_type"] == "LAB_RESULT"
+
+
+def observation_resource(document: dict) -> dict:
+    """Map a lab result document to a FHIR Observation resource."""
+    return {
+        "resourceType": "Observation",
+        "id": document["document_id"],
+        "meta": {"versionId": str(document["version"])},
+        "status": _OBSERVATION_STATUSES.get(document["status"], "unknown"),
+        "category": [
+            {
+                "coding": [
+                    {
+                        "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                        "code": "laboratory",
+                        "display": "Laboratory",
+                    }
+                ]
+            }
+        ],
+        "code": {"text": document["title"]},
+        "subject": {"reference": f"Patient/{document['patient_id']}"},
+        "effectiveDateTime": _instant(document["created_date"]),
+        "performer": [{"display": document["author"]}],
+        "valueString": document["content"],
+    }
+
+
+class ResourceCache:
+    """Serialized resources keyed by type and id, valid for one version."""
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, str], tuple[int, bytes]] = {}
+
+    def get(
+        self,
+        resource_type: str,
+        record_id: str,
+        record: dict,
+        mapper: Callable[[dict], dict],
+    ) -> bytes:
+        """Return the serialized resource for a record.
+
+        Args:
+            resource_type: FHIR resource type, e.g. ``Patient``.
+            record_id: Id of the record in the data store.
+            record: The record itself.
+            mapper: Function that maps the record to a FHIR resource.
+
+        Returns:
+            The resource as compact JSON bytes.
+        """
+        key = (resource_type, record_id)
+        cached: Optional[tuple[int, bytes]] = self._entries.get(key)
+        if cached is not None and cached[0] == record["version"]:
+            return cached[1]
+        payload = dumps(mapper(record))
+        self._entries[key] = (record["version"], payload)
+        return payload
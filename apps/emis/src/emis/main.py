@@ -1,6 +1,19 @@
-"""EPR E.M.I.S Server."""
+"""EPR E.M.I.S Server.
+
+FHIR R4 REST server that listens on HTTP port 8080 and serves Patient,
+Appointment and Observation resources.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+from typing import Optional
 
 import typer
+from emis.server import EMISServer
+from systemone.datastore import DataStore
+from systemone.main import EPRSystemOneServer
 
 app = typer.Typer(
     help="E.M.I.S EPR Server",
@@ -9,13 +22,60 @@ app = typer.Typer(
 )
 
 
+def setup_logging() -> logging.Logger:
+    """Setup logging configuration for console logs."""
+    logger = logging.getLogger("emis")
+    logger.setLevel(logging.INFO)
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    logger.addHandler(console_handler)
+
+    return logger
+
+
 @app.callback(invoke_without_command=True)
-def main(ctx: typer.Context) -> None:
+def main(
+    ctx: typer.Context,
+    host: str = "0.0.0.0",  # nosec
+    port: int = 8080,
+    seed: Optional[int] = typer.Option(None, help="Seed for the generated dataset."),
+    systemone_port: int = typer.Option(
+        0,
+        help="Also serve SystemOne on this port from the same dataset (0 disables).",
+    ),
+) -> None:
     """Main function to run the EPR E.M.I.S server."""
     typer.echo("EPR E.M.I.S Server")
     typer.echo(
-        "This server implements E.M.I.S EPR functionality with XML-based communication."
+        "This server implements E.M.I.S EPR functionality with FHIR R4 over HTTP."
     )
+    typer.echo(f"Listening on port {port} for FHIR requests.")
+
+    setup_logging()
+    store = DataStore(seed=seed)
+
+    system_one_server = None
+    if systemone_port:
+        system_one_server = EPRSystemOneServer(
+            host=host, port=systemone_port, store=store
+        )
+        threading.Thread(
+            target=system_one_server.start_server, name="systemone", daemon=True
+        ).start()
+
+    try:
+        asyncio.run(EMISServer(store, host=host, port=port).serve_forever())
+    except KeyboardInterrupt:
+        typer.echo("\n\nServer interrupted by user")
+    except Exception as e:
+        typer.echo(f"\nServer error: {e}")
+    finally:
+        if system_one_server is not None:
+            system_one_server.stop_server()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,441 @@
+"""Async HTTP/1.1 FHIR R4 server for the EMIS simulator."""
+
+import asyncio
+from logging import getLogger
+from typing import Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from emis.fhir import (
+    NHS_NUMBER_SYSTEM,
+    ResourceCache,
+    appointment_resource,
+    appointment_status,
+    dumps,
+    fhir_gender,
+    is_observation,
+    observation_resource,
+    patient_resource,
+)
+from systemone.datastore import DataStore
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+_CONTENT_TYPE = "application/fhir+json; charset=utf-8"
+
+
+class HTTPError(Exception):
+    """Error returned to the client as an OperationOutcome."""
+
+    def __init__(self, status: int, code: str, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _operation_outcome(code: str, message: str) -> bytes:
+    """Build an OperationOutcome body."""
+    return dumps(
+        {
+            "resourceType": "OperationOutcome",
+            "issue": [{"severity": "error", "code": code, "diagnostics": message}],
+        }
+    )
+
+
+def _reference_id(reference: str) -> str:
+    """Strip the resource type from a reference such as ``Patient/P1``."""
+    return reference.rpartition("/")[2]
+
+
+class EMISServer:
+    """FHIR R4 Patient, Appointment and Observation server.
+
+    Connections are kept alive between requests. Searches return paginated
+    ``searchset`` Bundles controlled by ``_count`` and ``_offset``, with a
+    ``next`` link while more results remain. Requests are dispatched on
+    worker threads, where they hold the store lock.
+    """
+
+    def __init__(
+        self,
+        store: DataStore,
+        host: str,
+        port: int = 8080,
+        keep_alive_timeout: float = 15.0,
+        default_count: int = 20,
+        max_count: int = 100,
+    ) -> None:
+        self.store = store
+        self.host = host
+        self.port = port
+        self.keep_alive_timeout = keep_alive_timeout
+        self.default_count = default_count
+        self.max_count = max_count
+        self._cache = ResourceCache()
+        self._server: Optional[asyncio.Server] = None
+        self._logger = getLogger(__name__)
+
+    async def start(self) -> None:
+        """Bind the listening socket."""
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        self._logger.info("EPR EMIS FHIR Server started on %s:%s", self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        """Start the server if needed and serve until cancelled."""
+        if self._server is None:
+            await self.start()
+        assert self._server is not None  # nosec
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve HTTP requests on one connection until it is closed."""
+        try:
+            while True:
+                request_line = await asyncio.wait_for(
+                    reader.readline(), self.keep_alive_timeout
+                )
+                if not request_line.strip():
+                    break
+                request = request_line.decode("latin-1").split()
+                if len(request) != 3:
+                    await self._send_bad_request(writer, "Malformed request line")
+                    break
+                method, target, version = request
+
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # Request bodies are not used by any endpoint
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send_bad_request(writer, "Invalid Content-Length")
+                    break
+                if length:
+                    await reader.readexactly(length)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (
+                    connection != "close"
+                    if version == "HTTP/1.1"
+                    else connection == "keep-alive"
+                )
+
+                # The store lock is shared with the embedded SystemOne server,
+                # which may hold it for a whole response, so it is never taken
+                # on the event loop.
+                status, body = await asyncio.to_thread(
+                    self.dispatch, method, target, headers.get("host")
+                )
+                await self._send(
+                    writer, version, status, body, keep_alive, method != "HEAD"
+                )
+                if not keep_alive:
+                    break
+        except (
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            ConnectionError,
+        ):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        version: str,
+        status: int,
+        body: bytes,
+        keep_alive: bool,
+        include_body: bool = True,
+    ) -> None:
+        """Write one response."""
+        head = (
+            f"{version} {status} {_REASONS[status]}\r\n"
+            f"Content-Type: {_CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1"))
+        if include_body:
+            writer.write(body)
+        await writer.drain()
+
+    async def _send_bad_request(
+        self, writer: asyncio.StreamWriter, message: str
+    ) -> None:
+        """Reject a request that cannot be parsed and close the connection.
+
+        The rest of the stream cannot be framed reliably, so the connection
+        is not kept alive.
+        """
+        body = _operation_outcome("structure", message)
+        await self._send(writer, "HTTP/1.1", 400, body, keep_alive=False)
+
+    def dispatch(
+        self, method: str, target: str, host: Optional[str] = None
+    ) -> tuple[int, bytes]:
+        """Handle one request and return the status code and JSON body.
+
+        Args:
+            method: HTTP method.
+            target: Request target including the query string.
+            host: Value of the Host header, used to build absolute URLs.
+
+        Returns:
+            The HTTP status code and response body.
+        """
+        base = f"http://{host or f'{self.host}:{self.port}'}"
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        parts = [part for part in url.path.split("/") if part]
+
+        try:
+            if method not in ("GET", "HEAD"):
+                raise HTTPError(
+                    405, "not-supported", f"Method {method} is not supported"
+                )
+            with self.store.lock:
+                return 200, self._route(base, parts, params)
+        except HTTPError as e:
+            return e.status, _operation_outcome(e.code, str(e))
+        except Exception as e:
+            self._logger.exception("Error handling %s %s", method, target)
+            return 500, _operation_outcome("exception", f"Server error: {e}")
+
+    def _route(self, base: str, parts: list[str], params: dict[str, str]) -> bytes:
+        """Route a GET request to a read or search handler."""
+        if parts == ["metadata"]:
+            return self._capability_statement()
+
+        resources: dict[str, tuple[dict, Callable[[dict], dict], Callable]] = {
+            "Patient": (self.store.patients, patient_resource, self._search_patients),
+            "Appointment": (
+                self.store.appointments,
+                appointment_resource,
+                self._search_appointments,
+            ),
+            "Observation": (
+                self.store.documents,
+                observation_resource,
+                self._search_observations,
+            ),
+        }
+        if not parts or parts[0] not in resources or len(parts) > 2:
+            raise HTTPError(
+                404, "not-found", f"Unknown resource path /{'/'.join(parts)}"
+            )
+
+        resource_type = parts[0]
+        records, mapper, search = resources[resource_type]
+        if len(parts) == 2:
+            record = records.get(parts[1])
+            if record is None or (
+                resource_type == "Observation" and not is_observation(record)
+            ):
+                raise HTTPError(
+                    404, "not-found", f"{resource_type}/{parts[1]} not found"
+                )
+            return self._cache.get(resource_type, parts[1], record, mapper)
+
+        matches = search(records, params)
+        return self._bundle(base, resource_type, matches, mapper, params)
+
+    def _search_patients(
+        self, records: dict, params: dict[str, str]
+    ) -> list[tuple[str, dict]]:
+        """Filter patients by name, identifier, gender and birthdate."""
+        name = params.get("name", "").lower()
+        identifier = params.get("identifier")
+        if identifier is not None:
+            system, _, value = identifier.rpartition("|")
+            if system and system != NHS_NUMBER_SYSTEM:
+                return []
+            identifier = value
+        gender = params.get("gender")
+        birthdate = params.get("birthdate")
+
+        matches = []
+        for patient_id, patient in records.items():
+            if name and not (
+                name in patient["first_name"].lower()
+                or name in patient["last_name"].lower()
+            ):
+                continue
+            if identifier is not None and patient["nhs_number"] != identifier:
+                continue
+            if gender is not None and fhir_gender(patient) != gender:
+                continue
+            if birthdate is not None and patient["date_of_birth"] != birthdate:
+                continue
+            matches.append((patient_id, patient))
+        return matches
+
+    def _search_appointments(
+        self, records: dict, params: dict[str, str]
+    ) -> list[tuple[str, dict]]:
+        """Filter appointments by patient and status."""
+        status = params.get("status")
+        patient = params.get("patient")
+        if patient is not None:
+            candidates = [
+                (appointment_id, records[appointment_id])
+                for appointment_id in sorted(
+                    self.store.appointments_by_patient.get(_reference_id(patient), ())
+                )
+            ]
+        else:
+            candidates = list(records.items())
+        if status is None:
+            return candidates
+        return [
+            (appointment_id, appointment)
+            for appointment_id, appointment in candidates
+            if appointment_status(appointment) == status
+        ]
+
+    def _search_observations(
+        self, records: dict, params: dict[str, str]
+    ) -> list[tuple[str, dict]]:
+        """Filter lab result observations by patient."""
+        patient = params.get("patient")
+        if patient is None:
+            candidates = list(records.items())
+        else:
+            candidates = [
+                (document_id, records[document_id])
+                for document_id in sorted(
+                    self.store.documents_by_patient.get(_reference_id(patient), ())
+                )
+            ]
+        return [
+            (document_id, document)
+            for document_id, document in candidates
+            if is_observation(document)
+        ]
+
+    def _bundle(
+        self,
+        base: str,
+        resource_type: str,
+        matches: list[tuple[str, dict]],
+        mapper: Callable[[dict], dict],
+        params: dict[str, str],
+    ) -> bytes:
+        """Build one page of a searchset Bundle from cached resources."""
+        try:
+            count = min(int(params.get("_count", self.default_count)), self.max_count)
+            offset = int(params.get("_offset", 0))
+        except ValueError:
+            raise HTTPError(400, "invalid", "_count and _offset must be integers")
+        if count < 0 or offset < 0:
+            raise HTTPError(400, "invalid", "_count and _offset must not be negative")
+
+        page = matches[offset : offset + count]
+        links = [
+            {
+                "relation": "self",
+                "url": f"{base}/{resource_type}?{urlencode(params)}",
+            }
+        ]
+        if offset + count < len(matches) and count:
+            next_params = {
+                **params,
+                "_count": str(count),
+                "_offset": str(offset + count),
+            }
+            links.append(
+                {
+                    "relation": "next",
+                    "url": f"{base}/{resource_type}?{urlencode(next_params)}",
+                }
+            )
+
+        head = dumps(
+            {
+                "resourceType": "Bundle",
+                "type": "searchset",
+                "total": len(matches),
+                "link": links,
+            }
+        )
+        # Splice the cached resource bytes into the Bundle rather than
+        # serializing every resource again. A record that cannot be mapped,
+        # e.g. one changed to an unexpected shape through SystemOne, is left
+        # out of the page instead of failing the whole search.
+        entries = []
+        for record_id, record in page:
+            try:
+                resource = self._cache.get(resource_type, record_id, record, mapper)
+            except (KeyError, TypeError, ValueError):
+                self._logger.exception(
+                    "Skipping %s/%s that cannot be mapped", resource_type, record_id
+                )
+                continue
+            entries.append(
+                b'{"fullUrl":'
+                + dumps(f"{base}/{resource_type}/{record_id}")
+                + b',"resource":'
+                + resource
+                + b"}"
+            )
+
+        # FHIR JSON does not allow empty arrays, so an empty page has no entry
+        if not entries:
+            return head
+        return head[:-1] + b',"entry":[' + b",".join(entries) + b"]}"
+
+    def _capability_statement(self) -> bytes:
+        """Describe the supported resources and search parameters."""
+        search_params = {
+            "Patient": ["name", "identifier", "gender", "birthdate"],
+            "Appointment": ["patient", "status"],
+            "Observation": ["patient"],
+        }
+        return dumps(
+            {
+                "resourceType": "CapabilityStatement",
+                "status": "active",
+                "kind": "instance",
+                "fhirVersion": "4.0.1",
+                "format": ["json"],
+                "rest": [
+                    {
+                        "mode": "server",
+                        "resource": [
+                            {
+                                "type": resource_type,
+                                "interaction": [
+                                    {"code": "read"},
+                                    {"code": "search-type"},
+                                ],
+                                "searchParam": [
+                                    {"name": name, "type": "string"}
+                                    for name in ["_count", "_offset", *names]
+                                ],
+                            }
+                            for resource_type, names in search_params.items()
+                        ],
+                    }
+                ],
+            }
+        )
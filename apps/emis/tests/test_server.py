@@ -0,0 +1,145 @@
+"""Tests for the EMIS FHIR server."""
+
+import asyncio
+import json
+
+import pytest
+from emis.server import EMISServer
+from systemone.datastore import DataStore
+
+
+@pytest.fixture
+def server() -> EMISServer:
+    """A FHIR server over a small seeded dataset, not bound to a port."""
+    return EMISServer(DataStore(seed=1), "127.0.0.1", 8080)
+
+
+def _get(server: EMISServer, target: str, method: str = "GET") -> tuple[int, dict]:
+    """Dispatch a request and decode the JSON body."""
+    status, body = server.dispatch(method, target, "fhir.test")
+    return status, json.loads(body)
+
+
+def test_read_patient(server: EMISServer) -> None:
+    """A patient is read by id with its version and address."""
+    patient = server.store.patients["P100001"]
+
+    status, resource = _get(server, "/Patient/P100001")
+
+    assert status == 200
+    assert resource["resourceType"] == "Patient"
+    assert resource["id"] == "P100001"
+    assert resource["meta"]["versionId"] == str(patient["version"])
+    assert resource["address"][0]["postalCode"] == patient["address"]["postcode"]
+
+
+def test_search_pages_with_next_links(server: EMISServer) -> None:
+    """Searches are paged by _count and _offset with a next link."""
+    total = len(server.store.patients)
+
+    status, first = _get(server, "/Patient?_count=2")
+    next_url = {link["relation"]: link["url"] for link in first["link"]}["next"]
+    _, last = _get(server, f"/Patient?_count=2&_offset={total - 1}")
+
+    assert status == 200
+    assert first["total"] == total
+    assert [entry["resource"]["id"] for entry in first["entry"]] == [
+        "P100000",
+        "P100001",
+    ]
+    assert first["entry"][0]["fullUrl"] == "http://fhir.test/Patient/P100000"
+    assert next_url == "http://fhir.test/Patient?_count=2&_offset=2"
+    assert len(last["entry"]) == 1
+    assert [link["relation"] for link in last["link"]] == ["self"]
+
+
+def test_empty_page_has_no_entry(server: EMISServer) -> None:
+    """FHIR JSON has no empty arrays, so an empty page omits entry."""
+    status, bundle = _get(server, "/Patient?name=no-such-patient")
+
+    assert status == 200
+    assert bundle["total"] == 0
+    assert "entry" not in bundle
+
+
+@pytest.mark.parametrize(
+    ("method", "target", "status", "code"),
+    [
+        ("GET", "/Patient/P999999", 404, "not-found"),
+        ("GET", "/Practitioner", 404, "not-found"),
+        ("POST", "/Patient", 405, "not-supported"),
+        ("GET", "/Patient?_count=many", 400, "invalid"),
+    ],
+)
+def test_errors_are_operation_outcomes(
+    server: EMISServer, method: str, target: str, status: int, code: str
+) -> None:
+    """Client errors get an OperationOutcome with a matching status."""
+    actual_status, outcome = _get(server, target, method)
+
+    assert actual_status == status
+    assert outcome["resourceType"] == "OperationOutcome"
+    assert outcome["issue"][0]["code"] == code
+
+
+def test_unmappable_record_fails_only_its_read(server: EMISServer) -> None:
+    """A broken record is a 500 on read and left out of searches."""
+    del server.store.patients["P100001"]["nhs_number"]
+
+    status, outcome = _get(server, "/Patient/P100001")
+    _, bundle = _get(server, "/Patient?_count=3")
+
+    assert status == 500
+    assert outcome["issue"][0]["code"] == "exception"
+    assert [entry["resource"]["id"] for entry in bundle["entry"]] == [
+        "P100000",
+        "P100002",
+    ]
+
+
+def test_unstructured_address_is_omitted(server: EMISServer) -> None:
+    """A patient whose address is not a dict is served without one."""
+    server.store.patients["P100001"]["address"] = "1 High Street"
+
+    status, resource = _get(server, "/Patient/P100001")
+
+    assert status == 200
+    assert "address" not in resource
+
+
+async def _exchange(server: EMISServer, request: bytes) -> bytes:
+    """Send raw bytes to a running server and read until it closes."""
+    await server.start()
+    assert server._server is not None
+    port = server._server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        server._server.close()
+        await server._server.wait_closed()
+
+
+@pytest.mark.parametrize(
+    "request_bytes",
+    [
+        b"GET /Patient\r\n\r\n",
+        b"GET /Patient HTTP/1.1\r\nContent-Length: lots\r\n\r\n",
+        b"GET /Patient HTTP/1.1\r\nContent-Length: -1\r\n\r\n",
+    ],
+    ids=["request-line", "content-length", "negative-length"],
+)
+def test_malformed_requests_get_400(request_bytes: bytes) -> None:
+    """Requests that cannot be framed get a 400 and the connection closes."""
+    server = EMISServer(DataStore(seed=1), "127.0.0.1", 0)
+
+    response = asyncio.run(_exchange(server, request_bytes))
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b"Connection: close" in head
+    assert json.loads(body)["resourceType"] == "OperationOutcome"
@@ -0,0 +1,116 @@
+"""Binary capture log for SystemOne request/response traffic.
+
+A capture file starts with an 8 byte magic header followed by one record per
+exchange. Each record is a fixed ``<ddII`` header (time the request was
+received, seconds taken to respond, request length, response length) followed
+by the raw request and response bytes.
+"""
+
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+CAPTURE_MAGIC = b"EPRCAP\x00\x01"
+_RECORD_HEADER = struct.Struct("<ddII")
+
+
+@dataclass
+class CapturedExchange:
+    """A single captured request/response pair."""
+
+    received_at: float
+    elapsed: float
+    request: bytes
+    response: bytes
+
+
+class CaptureWriter:
+    """Append request/response pairs to a capture file.
+
+    Writes are serialised with a lock so the writer can be shared between
+    connection handlers, and each record is flushed so a capture can be read
+    while the server is still running.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = Path(path)
+        self._lock = threading.Lock()
+        is_new = not self._path.exists() or self._path.stat().st_size == 0
+        if not is_new:
+            with self._path.open("rb") as existing:
+                _read_magic(existing, self._path)
+        self._file: BinaryIO = self._path.open("ab")
+        if is_new:
+            self._file.write(CAPTURE_MAGIC)
+
+    @property
+    def path(self) -> Path:
+        """Path of the capture file."""
+        return self._path
+
+    def write(
+        self, received_at: float, elapsed: float, request: bytes, response: bytes
+    ) -> None:
+        """Append one exchange to the capture file.
+
+        Args:
+            received_at: Epoch time at which the request was received.
+            elapsed: Seconds taken to produce the response.
+            request: Raw request bytes.
+            response: Raw response bytes.
+        """
+        header = _RECORD_HEADER.pack(received_at, elapsed, len(request), len(response))
+        with self._lock:
+            self._file.write(header)
+            self._file.write(request)
+            self._file.write(response)
+            self._file.flush()
+
+    def close(self) -> None:
+        """Flush and close the capture file."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _read_magic(stream: BinaryIO, path: Path) -> None:
+    """Check the capture file header."""
+    if stream.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+        raise ValueError(f"{path} is not a SystemOne capture file")
+
+
+def read_capture(path: str) -> Iterator[CapturedExchange]:
+    """Iterate over the exchanges stored in a capture file.
+
+    Args:
+        path: Path of the capture file.
+
+    Yields:
+        Captured exchanges in the order they were written.
+    """
+    capture_path = Path(path)
+    with capture_path.open("rb") as stream:
+        # Stop at the size seen on open so records appended while reading,
+        # e.g. when replaying against a server that is still capturing to
+        # the same file, are not picked up.
+        end = capture_path.stat().st_size
+        _read_magic(stream, capture_path)
+        while stream.tell() < end:
+            header = stream.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                raise ValueError(f"Truncated record header in {capture_path}")
+            received_at, elapsed, request_len, response_len = _RECORD_HEADER.unpack(
+                header
+            )
+            request = stream.read(request_len)
+            response = stream.read(response_len)
+            if len(request) < request_len or len(response) < response_len:
+                raise ValueError(f"Truncated record body in {capture_path}")
+            yield CapturedExchange(
+                received_at=received_at,
+                elapsed=elapsed,
+                request=request,
+                response=response,
+            )
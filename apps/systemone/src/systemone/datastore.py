@@ -0,0 +1,432 @@
+"""In-memory practice dataset shared by the EPR simulators."""
+
+import random
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional
+from uuid import uuid4
+
+if TYPE_CHECKING:
+    from faker import Faker
+
+# Fields that identify or version a patient and are never updated by clients
+_READ_ONLY_PATIENT_FIELDS = ("patient_id", "version")
+
+
+class DataStore:
+    """Patients, appointments and documents for a single practice.
+
+    Each store owns its own seeded generators, relationship indexes and lock,
+    so several stores can be used side by side without sharing state.
+    Callers must hold ``lock`` while reading or mutating the tables.
+
+    Every record carries a ``version``. Each change takes the next value of
+    the store-wide ``version`` counter and is appended to ``change_log``, so
+    the records changed since any earlier version can be found without
+    scanning the tables. Versions only exist in memory, so each store has a
+    random ``epoch`` and watermarks are only meaningful within one epoch.
+
+    Generated appointment and document dates are relative to
+    ``reference_time``. Two stores with the same seed and reference time
+    hold identical data.
+    """
+
+    def __init__(
+        self,
+        organisation_name: str = "System One Test Practice",
+        organisation_code: str = "TEST001",
+        seed: Optional[int] = None,
+        reference_time: Optional[datetime] = None,
+    ) -> None:
+        self.organisation_name = organisation_name
+        self.organisation_code = organisation_code
+        self.seed = seed
+        if reference_time is None:
+            reference_time = datetime.now()
+            if seed is not None:
+                # A seeded dataset must be reproducible across restarts, so
+                # generated dates are relative to midnight rather than now.
+                reference_time = reference_time.replace(
+                    hour=0, minute=0, second=0, microsecond=0
+                )
+        self.reference_time = reference_time
+        self.lock = threading.RLock()
+        self._random = random.Random(seed)  # nosec
+        self._fake = self._create_faker()
+        if seed is not None:
+            self._fake.seed_instance(seed)
+        self.patients = self._initialize_patient_database()
+        self.appointments = self._initialize_appointment_database()
+        self.documents = self._initialize_document_database()
+        self.appointments_by_patient: defaultdict[str, set[str]] = defaultdict(set)
+        self.documents_by_patient: defaultdict[str, set[str]] = defaultdict(set)
+        self._build_indexes()
+        self.epoch = str(uuid4()).upper()
+        self.version = 0
+        self.change_log: list[tuple[int, str, str]] = []
+
+    @staticmethod
+    def _create_faker() -> "Faker":
+        """Create the Faker generator.
+
+        Faker is imported here rather than at module level because importing
+        it loads all of its providers, which dominates server startup time.
+        """
+        from faker import Faker
+
+        return Faker("en_GB")
+
+    def _initialize_patient_database(self) -> dict:
+        """Initialize sample patient database."""
+        patients = {}
+        today = self.reference_time.date()
+        for i in range(20):
+            patient_id = f"P{100000 + i}"
+            patients[patient_id] = {
+                "patient_id": patient_id,
+                "first_name": self._fake.first_name(),
+                "last_name": self._fake.last_name(),
+                "date_of_birth": self._fake.date_between_dates(
+                    date_start=(today - timedelta(days=91 * 365)),
+                    date_end=(today - timedelta(days=18 * 365)),
+                ).isoformat(),
+                "gender": self._random.choice(["M", "F", "U"]),  # nosec
+                "nhs_number": f"{self._random.randint(100000000, 999999999)}",  # nosec
+                "address": {
+                    "line1": self._fake.building_number()
+                    + " "
+                    + self._fake.street_name(),
+                    "line2": (
+                        self._fake.secondary_address()
+                        if self._random.choice([True, False])  # nosec
+                        else ""
+                    ),
+                    "city": self._fake.city(),
+                    "postcode": self._fake.postcode(),
+                },
+                "phone": self._fake.phone_number(),
+                "email": self._fake.email(),
+                "version": 0,
+            }
+        return patients
+
+    def _initialize_appointment_database(self) -> dict:
+        """Initialize sample appointment database."""
+        appointments = {}
+        for i in range(50):
+            appointment_id = f"A{100000 + i}"
+            appointments[appointment_id] = {
+                "appointment_id": appointment_id,
+                "patient_id": f"P{100000 + self._random.randint(0, 19)}",  # nosec
+                "appointment_type": self._random.choice(
+                    [
+                        "GP_CONSULTATION",
+                        "SPECIALIST_REFERRAL",
+                        "BLOOD_TEST",
+                        "VACCINATION",
+                        "REVIEW",
+                    ]
+                ),  # nosec
+                "scheduled_time": (
+                    self.reference_time
+                    + timedelta(
+                        days=self._random.randint(1, 30),  # nosec
+                        hours=self._random.randint(9, 17),  # nosec
+                    )
+                ).isoformat(),
+                "duration_minutes": self._random.choice([15, 20, 30, 45, 60]),  # nosec
+                "status": self._random.choice(
+                    ["SCHEDULED", "CONFIRMED", "CANCELLED", "COMPLETED", "NO_SHOW"]
+                ),  # nosec
+                "location": self._random.choice(
+                    ["Main Surgery", "Branch Surgery", "Community Clinic", "Hospital"]
+                ),  # nosec
+                "clinician_id": f"CLIN{self._random.randint(1000, 9999)}",  # nosec
+                "notes": self._random.choice(
+                    [
+                        "Regular check-up",
+                        "Follow-up appointment",
+                        "New patient consultation",
+                        "Annual review",
+                    ]
+                ),  # nosec
+                "version": 0,
+            }
+        return appointments
+
+    def _initialize_document_database(self) -> dict:
+        """Initialize sample document database."""
+        documents = {}
+        for i in range(30):
+            doc_id = f"DOC{100000 + i}"
+            documents[doc_id] = {
+                "document_id": doc_id,
+                "patient_id": f"P{100000 + self._random.randint(0, 19)}",  # nosec
+                "document_type": self._random.choice(
+                    ["CONSULTATION", "LETTER", "REPORT", "PRESCRIPTION", "LAB_RESULT"]
+                ),  # nosec
+                "title": self._random.choice(
+                    [
+                        "Consultation Notes",
+                        "Referral Letter",
+                        "Lab Report",
+                        "Prescription",
+                        "Discharge Summary",
+                    ]
+                ),  # nosec
+                "content": self._fake.text(max_nb_chars=500),
+                "created_date": (
+                    self.reference_time
+                    - timedelta(days=self._random.randint(1, 365))  # nosec
+                ).isoformat(),
+                "author": f"Dr. {self._fake.last_name()}",
+                "status": self._random.choice(
+                    ["DRAFT", "FINAL", "SENT", "ARCHIVED"]
+                ),  # nosec
+                "version": 0,
+            }
+        return documents
+
+    def _build_indexes(self) -> None:
+        """Build the patient relationship indexes from the tables."""
+        for appointment_id, appointment in self.appointments.items():
+            self.appointments_by_patient[appointment["patient_id"]].add(appointment_id)
+        for document_id, document in self.documents.items():
+            self.documents_by_patient[document["patient_id"]].add(document_id)
+
+    @property
+    def tables(self) -> dict[str, dict]:
+        """Tables keyed by their DataExtract type."""
+        return {
+            "PATIENTS": self.patients,
+            "APPOINTMENTS": self.appointments,
+            "DOCUMENTS": self.documents,
+        }
+
+    def _record_change(self, table: str, record_id: str) -> int:
+        """Assign the next version to a changed record and log the change."""
+        return self._record_changes(table, [record_id])
+
+    def _record_changes(self, table: str, record_ids: list[str]) -> int:
+        """Assign versions to changed records and log them in one pass."""
+        records = self.tables[table]
+        entries = []
+        for record_id in record_ids:
+            self.version += 1
+            entries.append((self.version, table, record_id))
+            record = records.get(record_id)
+            if record is not None:
+                record["version"] = self.version
+        self.change_log.extend(entries)
+        return self.version
+
+    def is_current_watermark(self, since_version: int, epoch: Optional[str]) -> bool:
+        """Return whether a watermark can be resumed from with a delta.
+
+        A watermark without an epoch or from another epoch, e.g. from before
+        a restart or an eviction, or one ahead of the current version cannot
+        be trusted and the client must take a full extract instead.
+        """
+        return epoch == self.epoch and since_version <= self.version
+
+    def changes_since(
+        self, table: str, since_version: int
+    ) -> tuple[list[dict], list[dict]]:
+        """Return records of a table changed after ``since_version``.
+
+        Args:
+            table: DataExtract type of the table, e.g. ``PATIENTS``.
+            since_version: Version watermark from a previous extract.
+
+        Returns:
+            The changed records that still exist, and tombstones with the
+            ``record_id`` and deletion ``version`` of removed records.
+        """
+        start = bisect_right(self.change_log, since_version, key=lambda c: c[0])
+        latest: dict[str, int] = {}
+        for version, changed_table, record_id in self.change_log[start:]:
+            if changed_table == table:
+                latest[record_id] = version
+
+        records = self.tables[table]
+        changed = []
+        deleted = []
+        for record_id, version in latest.items():
+            record = records.get(record_id)
+            if record is not None:
+                changed.append(record)
+            else:
+                deleted.append({"record_id": record_id, "version": version})
+        return changed, deleted
+
+    def update_patient(self, patient_id: str, fields: dict) -> bool:
+        """Update existing fields of a patient and return whether it exists.
+
+        Raises:
+            ValueError: If a value does not have the type of the field it
+                replaces; nothing is updated.
+        """
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            return False
+        invalid = _invalid_patient_fields(patient, fields)
+        if invalid:
+            raise ValueError(f"Invalid value for {', '.join(invalid)}")
+        if self._apply_patient_fields(patient, fields):
+            self._record_change("PATIENTS", patient_id)
+        return True
+
+    def _apply_patient_fields(self, patient: dict, fields: dict) -> bool:
+        """Copy fields that exist on the patient and return whether any did.
+
+        The values must already have been checked with
+        ``_invalid_patient_fields``.
+        """
+        updated = False
+        for key, value in fields.items():
+            if key in patient and key not in _READ_ONLY_PATIENT_FIELDS:
+                patient[key] = value
+                updated = True
+        return updated
+
+    def update_patients(self, updates: list[tuple[str, dict]]) -> list[str]:
+        """Apply several patient updates atomically.
+
+        Args:
+            updates: Pairs of patient id and the fields to update.
+
+        Returns:
+            A status per update: ``OK``, ``NOT_FOUND`` or ``INVALID_FIELD``
+            when a value does not have the type of the field it replaces.
+            If any update fails nothing is applied and the valid updates are
+            reported as ``NOT_APPLIED``.
+        """
+        statuses = []
+        for patient_id, fields in updates:
+            patient = self.patients.get(patient_id)
+            if patient is None:
+                statuses.append("NOT_FOUND")
+            elif _invalid_patient_fields(patient, fields):
+                statuses.append("INVALID_FIELD")
+            else:
+                statuses.append("OK")
+        if any(status != "OK" for status in statuses):
+            return [_not_applied(status) for status in statuses]
+
+        changed = [
+            patient_id
+            for patient_id, fields in updates
+            if self._apply_patient_fields(self.patients[patient_id], fields)
+        ]
+        self._record_changes("PATIENTS", list(dict.fromkeys(changed)))
+        return statuses
+
+    def delete_items(self, items: list[tuple[str, str, str]]) -> list[str]:
+        """Delete several appointments and documents atomically.
+
+        The relationship indexes are updated once per patient and the change
+        log once per table, rather than once per item.
+
+        Args:
+            items: Triples of patient id, item type (``APPOINTMENT`` or
+                ``DOCUMENT``) and item id.
+
+        Returns:
+            A status per item: ``OK``, ``PATIENT_NOT_FOUND``,
+            ``INVALID_TYPE`` or ``NOT_FOUND``, also used for an item of
+            another patient. If any item fails nothing is deleted and the
+            valid items are reported as ``NOT_APPLIED``.
+        """
+        targets = {
+            "APPOINTMENT": (
+                "APPOINTMENTS",
+                self.appointments,
+                self.appointments_by_patient,
+            ),
+            "DOCUMENT": ("DOCUMENTS", self.documents, self.documents_by_patient),
+        }
+        statuses = []
+        seen: set[tuple[str, str]] = set()
+        for patient_id, item_type, item_id in items:
+            if patient_id not in self.patients:
+                statuses.append("PATIENT_NOT_FOUND")
+            elif item_type not in targets:
+                statuses.append("INVALID_TYPE")
+            elif (
+                item_id not in targets[item_type][2].get(patient_id, ())
+                or (item_type, item_id) in seen
+            ):
+                statuses.append("NOT_FOUND")
+            else:
+                seen.add((item_type, item_id))
+                statuses.append("OK")
+        if any(status != "OK" for status in statuses):
+            return [_not_applied(status) for status in statuses]
+
+        for item_type, (table, records, index) in targets.items():
+            removed = [item_id for kind, item_id in seen if kind == item_type]
+            if not removed:
+                continue
+            by_patient: defaultdict[str, list[str]] = defaultdict(list)
+            for item_id in removed:
+                by_patient[records.pop(item_id)["patient_id"]].append(item_id)
+            for patient_id, item_ids in by_patient.items():
+                index[patient_id].difference_update(item_ids)
+            self._record_changes(table, sorted(removed))
+        return statuses
+
+    def patient_appointments(self, patient_id: str) -> list[dict]:
+        """Return the appointments for a patient."""
+        return [
+            self.appointments[appointment_id]
+            for appointment_id in sorted(
+                self.appointments_by_patient.get(patient_id, ())
+            )
+        ]
+
+    def patient_documents(self, patient_id: str) -> list[dict]:
+        """Return the documents for a patient."""
+        return [
+            self.documents[document_id]
+            for document_id in sorted(self.documents_by_patient.get(patient_id, ()))
+        ]
+
+    def delete_appointment(self, appointment_id: str) -> bool:
+        """Delete an appointment and return whether it existed."""
+        appointment = self.appointments.pop(appointment_id, None)
+        if appointment is None:
+            return False
+        self.appointments_by_patient[appointment["patient_id"]].discard(appointment_id)
+        self._record_change("APPOINTMENTS", appointment_id)
+        return True
+
+    def delete_document(self, document_id: str) -> bool:
+        """Delete a document and return whether it existed."""
+        document = self.documents.pop(document_id, None)
+        if document is None:
+            return False
+        self.documents_by_patient[document["patient_id"]].discard(document_id)
+        self._record_change("DOCUMENTS", document_id)
+        return True
+
+
+def _invalid_patient_fields(patient: dict, fields: dict) -> list[str]:
+    """Return the updated fields whose value has a different type.
+
+    Values from requests are strings, so this keeps structured fields such
+    as ``address`` from being replaced by text.
+    """
+    return [
+        key
+        for key, value in fields.items()
+        if key in patient
+        and key not in _READ_ONLY_PATIENT_FIELDS
+        and type(value) is not type(patient[key])
+    ]
+
+
+def _not_applied(status: str) -> str:
+    """Report a valid item of a failed batch as not applied."""
+    return "NOT_APPLIED" if status == "OK" else status
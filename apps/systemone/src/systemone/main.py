@@ -3,16 +3,29 @@
 Main server that listens on TCP port 40700 and handles XML requests.
 """
 
+import json
 import logging
 import signal
 import socket
 import sys
+import threading
+import time
+from datetime import datetime
 from logging import Logger
+from pathlib import Path
 from socket import socket as Socket
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 
 import typer
+from systemone.capture import CaptureWriter
+from systemone.datastore import DataStore
+from systemone.profiling import RequestProfiler, StackSampler
 from systemone.systemone import SystemOne
+from systemone.tenancy import PracticeRouter, generate_practices, load_practices
+
+if TYPE_CHECKING:
+    # lxml is only imported when validation is enabled
+    from systemone.validation import MessageValidator
 
 app = typer.Typer(
     help="System One EPR Server",
@@ -46,13 +59,96 @@ def setup_logging() -> logging.Logger:
 class EPRSystemOneServer:
     """EPR System One TCP Server."""
 
-    def __init__(self, host: str, port: int = 40700) -> None:
+    def __init__(
+        self,
+        host: str,
+        port: int = 40700,
+        capture_path: Optional[str] = None,
+        profiler: Optional[RequestProfiler] = None,
+        stack_sampler: Optional[StackSampler] = None,
+        router: Optional[PracticeRouter] = None,
+        store: Optional[DataStore] = None,
+        seed: Optional[int] = None,
+        reference_time: Optional[datetime] = None,
+        validator: Optional["MessageValidator"] = None,
+        validate_strict: bool = False,
+        ready_file: Optional[str] = None,
+    ) -> None:
         self.host = host
         self.port = port
         self.server_socket: Optional[Socket] = None
         self.running: bool = False
         self.logger: Logger = setup_logging()
-        self.system_one: SystemOne = SystemOne()
+        self.profiler: RequestProfiler = profiler or RequestProfiler("profiles")
+        self.stack_sampler: StackSampler = stack_sampler or StackSampler(
+            "profiles/stacks.folded"
+        )
+        # The request handler (and its dataset) is built in the background
+        # once the socket is listening; connections wait on ``_loaded``,
+        # which is set whether loading succeeded (``ready``) or failed.
+        self._router = router
+        self._store = store
+        self._seed = seed
+        self._reference_time = reference_time
+        self.system_one: Optional[SystemOne | PracticeRouter] = None
+        self.ready = threading.Event()
+        self._loaded = threading.Event()
+        self.load_error: Optional[str] = None
+        self.ready_file: Optional[Path] = Path(ready_file) if ready_file else None
+        self._created_at = time.perf_counter()
+        self._ready_seconds: Optional[float] = None
+        self.capture: Optional[CaptureWriter] = (
+            CaptureWriter(capture_path) if capture_path else None
+        )
+        self.validator: Optional["MessageValidator"] = validator
+        self.validate_strict: bool = validate_strict
+
+    def health(self) -> dict:
+        """Report whether the server is listening and ready for requests."""
+        if self.load_error is not None:
+            status = "failed"
+        else:
+            status = "ready" if self.ready.is_set() else "starting"
+        return {
+            "status": status,
+            "listening": self.running,
+            "host": self.host,
+            "port": self.port,
+            "startup_ms": (
+                round(self._ready_seconds * 1000)
+                if self._ready_seconds is not None
+                else None
+            ),
+        }
+
+    def _load_handler(self) -> None:
+        """Build the request handler and signal readiness."""
+        try:
+            self.system_one = self._router or SystemOne(
+                store=self._store
+                or DataStore(seed=self._seed, reference_time=self._reference_time),
+                profiler=self.profiler,
+            )
+        except Exception as e:
+            self.logger.error("Error loading data: %s", e)
+            self.load_error = str(e)
+            self._loaded.set()
+            self.stop_server()
+            return
+
+        self._ready_seconds = time.perf_counter() - self._created_at
+        self.ready.set()
+        self._loaded.set()
+        if self.ready_file:
+            try:
+                self.ready_file.write_text(json.dumps(self.health()), encoding="utf-8")
+            except OSError as e:
+                self.logger.error(
+                    "Could not write ready file %s: %s", self.ready_file, e
+                )
+        self.logger.info(
+            "EPR System One Server ready in %.0fms", self._ready_seconds * 1000
+        )
 
     def start_server(self) -> None:
         """Start the EPR System One server."""
@@ -61,9 +157,27 @@ class EPRSystemOneServer:
             self.logger.info("Received signal %s, shutting down server...", signum)
             self.stop_server()
 
-        # Set up signal handlers for graceful shutdown
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+        # Set up signal handlers for graceful shutdown. Signals can only be
+        # handled on the main thread, so a server embedded in another
+        # process (e.g. alongside EMIS) is stopped by its owner instead.
+        in_main_thread = threading.current_thread() is threading.main_thread()
+        if in_main_thread:
+            signal.signal(signal.SIGINT, signal_handler)
+            signal.signal(signal.SIGTERM, signal_handler)
+
+        # Profiling can be toggled at runtime where the platform supports it.
+        # Stopping the stack sampler joins its thread and writes a file, so
+        # it is handed to a helper thread rather than run in the handler.
+        if in_main_thread and hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.profiler.toggle())
+            signal.signal(
+                signal.SIGUSR2,
+                lambda *_: threading.Thread(
+                    target=self.stack_sampler.toggle,
+                    name="stack-sampler-toggle",
+                    daemon=True,
+                ).start(),
+            )
 
         try:
             self.server_socket = Socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -76,6 +190,11 @@ class EPRSystemOneServer:
             self.logger.info(
                 "EPR System One Server started on %s:%s", self.host, self.port
             )
+            threading.Thread(
+                target=self._load_handler, name="systemone-loader", daemon=True
+            ).start()
+            if self.capture:
+                self.logger.info("Capturing traffic to %s", self.capture.path)
             self.logger.info("Waiting for ClientIntegrationRequest messages...")
             self.logger.info("Press Ctrl+C to stop the server")
 
@@ -110,12 +229,26 @@ class EPRSystemOneServer:
                 data += chunk
 
             if data:
+                received_at = time.time()
+                started = time.perf_counter()
+                validate = self.validator is not None and self.validator.sample()
                 try:
+                    if validate:
+                        errors = self.validator.check_request(data)
+                        if errors and self.validate_strict:
+                            raise ValueError(
+                                f"Request failed schema validation: {errors[0]}"
+                            )
+
                     # Process request through SystemOne handler
+                    self._loaded.wait()
+                    if self.system_one is None:
+                        raise RuntimeError(f"Data failed to load: {self.load_error}")
                     response_xml = self.system_one.handle(data)
 
                     # Send response back to client
-                    client_socket.sendall(response_xml.encode("utf-8"))
+                    response = response_xml.encode("utf-8")
+                    client_socket.sendall(response)
                     self.logger.info("Response sent to %s", address)
 
                 except Exception as e:
@@ -128,7 +261,15 @@ class EPRSystemOneServer:
     <ErrorMessage>Server error: {e}</ErrorMessage>
     <ResponseUID>ERROR-{address[0]}-{address[1]}</ResponseUID>
 </ClientIntegrationResponse>"""
-                    client_socket.sendall(error_response.encode("utf-8"))
+                    response = error_response.encode("utf-8")
+                    client_socket.sendall(response)
+
+                if self.capture:
+                    self.capture.write(
+                        received_at, time.perf_counter() - started, data, response
+                    )
+                if validate:
+                    self.validator.check_response(response)
 
             client_socket.close()
             self.logger.info("Connection from %s closed", address)
@@ -149,11 +290,80 @@ class EPRSystemOneServer:
                 self.logger.info("EPR System One Server stopped")
             except Exception:
                 pass
+        if self.capture:
+            self.capture.close()
+        self.stack_sampler.stop()
+        if self.ready_file:
+            try:
+                self.ready_file.unlink(missing_ok=True)
+            except OSError as e:
+                self.logger.error(
+                    "Could not remove ready file %s: %s", self.ready_file, e
+                )
 
 
 @app.callback(invoke_without_command=True)
-def main(ctx: typer.Context, host: str = "0.0.0.0", port: int = 40700) -> None:  # nosec
+def main(
+    ctx: typer.Context,
+    host: str = "0.0.0.0",  # nosec
+    port: int = 40700,
+    capture: Optional[str] = typer.Option(
+        None, help="Append every request and response to this capture file."
+    ),
+    profile: bool = typer.Option(
+        False, help="Profile requests with cProfile (toggle at runtime with SIGUSR1)."
+    ),
+    profile_every: int = typer.Option(1, help="Profile every Nth matching request."),
+    profile_function: Optional[list[str]] = typer.Option(
+        None, help="Only profile requests for this function (repeatable)."
+    ),
+    profile_stacks: bool = typer.Option(
+        False,
+        help="Sample thread stacks in collapsed format (toggle with SIGUSR2).",
+    ),
+    profile_interval_ms: float = typer.Option(
+        5.0, help="Stack sampling interval in milliseconds."
+    ),
+    profile_dir: str = typer.Option(
+        "profiles", help="Directory for profiles and collapsed stacks."
+    ),
+    seed: Optional[int] = typer.Option(
+        None, help="Seed for the generated dataset, for reproducible replays."
+    ),
+    reference_date: Optional[datetime] = typer.Option(
+        None,
+        formats=["%Y-%m-%d"],
+        help="Generate dataset dates relative to this day (default today).",
+    ),
+    practices: int = typer.Option(
+        0, help="Simulate this many practices, routed by DeviceID."
+    ),
+    practices_file: Optional[str] = typer.Option(
+        None, help="JSON file defining the practices to simulate."
+    ),
+    memory_budget_mb: float = typer.Option(
+        256.0, help="Memory budget for loaded practice datasets."
+    ),
+    validate_requests: bool = typer.Option(
+        False, help="Validate requests against ClientIntegrationRequest.xsd."
+    ),
+    validate_responses: bool = typer.Option(
+        False, help="Validate responses against ClientIntegrationResponse.xsd."
+    ),
+    validate_sample: int = typer.Option(
+        1, help="Only validate one in every N exchanges."
+    ),
+    validate_strict: bool = typer.Option(
+        False, help="Reject requests that fail schema validation."
+    ),
+    ready_file: Optional[str] = typer.Option(
+        None, help="Write server health to this file once ready for requests."
+    ),
+) -> None:
     """Main function to run the EPR System One server."""
+    if ctx.invoked_subcommand is not None:
+        return
+
     typer.echo("EPR System One Server")
     typer.echo(
         "This server implements System One EPR functionality with XML-based communication."
@@ -161,7 +371,53 @@ def main(ctx: typer.Context, host: str = "0.0.0.0", port: int = 40700) -> None:
     typer.echo(f"Listening on port {port} for ClientIntegrationRequest messages.")
 
     try:
-        server = EPRSystemOneServer(host=host, port=port)
+        profiler = RequestProfiler(
+            profile_dir,
+            every_n=profile_every,
+            function_names=profile_function or (),
+            enabled=profile,
+        )
+        stack_sampler = StackSampler(
+            f"{profile_dir}/stacks.folded", interval=profile_interval_ms / 1000
+        )
+        if profile_stacks:
+            stack_sampler.start()
+
+        router = None
+        if practices_file or practices:
+            router = PracticeRouter(
+                (
+                    load_practices(practices_file)
+                    if practices_file
+                    else generate_practices(practices)
+                ),
+                memory_budget_mb=memory_budget_mb,
+                profiler=profiler,
+            )
+
+        validator = None
+        if validate_requests or validate_responses:
+            from systemone.validation import MessageValidator
+
+            validator = MessageValidator(
+                validate_requests=validate_requests,
+                validate_responses=validate_responses,
+                sample_rate=validate_sample,
+            )
+
+        server = EPRSystemOneServer(
+            host=host,
+            port=port,
+            capture_path=capture,
+            profiler=profiler,
+            stack_sampler=stack_sampler,
+            router=router,
+            seed=seed,
+            reference_time=reference_date,
+            validator=validator,
+            validate_strict=validate_strict,
+            ready_file=ready_file,
+        )
         server.start_server()
     except KeyboardInterrupt:
         typer.echo("\n\nServer interrupted by user")
@@ -169,6 +425,39 @@ def main(ctx: typer.Context, host: str = "0.0.0.0", port: int = 40700) -> None:
         typer.echo(f"\nServer error: {e}")
 
 
+@app.command()
+def replay(
+    capture_file: str,
+    host: str = "127.0.0.1",
+    port: int = 40700,
+    speed: float = typer.Option(
+        1.0, help="Replay speed multiplier, 0 sends as fast as possible."
+    ),
+    concurrency: int = typer.Option(1, help="Number of concurrent connections."),
+    show_diffs: bool = typer.Option(False, help="Print response diffs."),
+) -> None:
+    """Replay a capture file against a running server and diff responses."""
+    from systemone.replay import replay_capture
+
+    report = replay_capture(
+        capture_file, host=host, port=port, speed=speed, concurrency=concurrency
+    )
+
+    if show_diffs:
+        for result in report.results:
+            if result.error is not None:
+                typer.echo(f"Request {result.index} failed: {result.error}")
+            elif not result.matched:
+                typer.echo(f"Request {result.index} differs:\n{result.diff}")
+
+    typer.echo(
+        f"Replayed {report.total} requests in {report.wall_time:.2f}s "
+        f"({report.throughput:.1f} req/s)"
+    )
+    typer.echo(f"Mismatched responses: {report.mismatches}, errors: {report.errors}")
+    if report.mismatches or report.errors:
+        raise typer.Exit(code=1)
+
+
 if __name__ == "__main__":
     app()
-    app()
@@ -0,0 +1,199 @@
+"""Runtime-togglable profiling for the SystemOne server.
+
+Two profilers are provided:
+
+* ``RequestProfiler`` runs cProfile around selected requests (every Nth
+  request and/or only chosen functions) and writes one ``.prof`` file per
+  profiled request.
+* ``StackSampler`` periodically samples the stacks of all server threads and
+  writes them in collapsed-stack format, ready for ``flamegraph.pl`` or
+  speedscope.
+
+Both are off by default and cost a single attribute check per request while
+disabled.
+"""
+
+import cProfile
+import itertools
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from logging import getLogger
+from pathlib import Path
+from types import FrameType
+from typing import Iterable, Iterator, Optional
+
+_NOT_PROFILED = nullcontext()
+_UNSAFE_FILE_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+
+
+class RequestProfiler:
+    """Profile a sample of requests with cProfile."""
+
+    def __init__(
+        self,
+        output_dir: str,
+        every_n: int = 1,
+        function_names: Iterable[str] = (),
+        enabled: bool = False,
+    ) -> None:
+        if every_n < 1:
+            raise ValueError("every_n must be at least 1")
+        self.output_dir = Path(output_dir)
+        self.every_n = every_n
+        self.function_names = {name.lower() for name in function_names}
+        self.enabled = enabled
+        self._counter = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._logger = getLogger(__name__)
+
+    def toggle(self) -> bool:
+        """Switch request profiling on or off and return the new state."""
+        self.enabled = not self.enabled
+        self._logger.info(
+            "Request profiling %s", "enabled" if self.enabled else "disabled"
+        )
+        return self.enabled
+
+    def should_profile(self, function_name: str) -> bool:
+        """Return whether a request for the given function is profiled."""
+        if not self.enabled:
+            return False
+        if self.function_names and function_name.lower() not in self.function_names:
+            return False
+        return next(self._counter) % self.every_n == 0
+
+    def profile(self, function_name: str) -> AbstractContextManager:
+        """Return a context manager that profiles the request if sampled."""
+        if not self.should_profile(function_name):
+            return _NOT_PROFILED
+        return self._profile(function_name)
+
+    @contextmanager
+    def _profile(self, function_name: str) -> Iterator[None]:
+        """Run cProfile for the duration of the block and dump the stats."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            file_name = _UNSAFE_FILE_CHARS.sub("_", function_name) or "request"
+            path = self.output_dir / f"{file_name}-{next(self._file_ids)}.prof"
+            try:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(path)
+            except OSError as e:
+                # Profiling must never fail the request being profiled
+                self._logger.error("Could not write profile to %s: %s", path, e)
+            else:
+                self._logger.info("Wrote profile for %s to %s", function_name, path)
+
+
+class StackSampler:
+    """Sample thread stacks periodically and write collapsed stacks."""
+
+    def __init__(
+        self,
+        output_path: str,
+        interval: float = 0.005,
+        flush_interval: float = 10.0,
+    ) -> None:
+        self.output_path = Path(output_path)
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self._stacks: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        # Serialises start/stop, which may be requested from several threads
+        self._control_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._logger = getLogger(__name__)
+
+    @property
+    def running(self) -> bool:
+        """Whether the sampler thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        with self._control_lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="stack-sampler", daemon=True
+            )
+            self._thread.start()
+        self._logger.info("Stack sampling started, writing to %s", self.output_path)
+
+    def stop(self) -> None:
+        """Stop sampling and write the collected stacks."""
+        with self._control_lock:
+            if not self.running:
+                return
+            self._stop.set()
+            assert self._thread is not None  # nosec
+            self._thread.join()
+            self._thread = None
+            self.flush()
+        self._logger.info("Stack sampling stopped")
+
+    def toggle(self) -> bool:
+        """Start or stop sampling and return whether it is now running."""
+        with self._control_lock:
+            if self.running:
+                self.stop()
+            else:
+                self.start()
+            return self.running
+
+    def flush(self) -> None:
+        """Write all stacks collected so far in collapsed-stack format."""
+        with self._lock:
+            lines = [f"{stack} {count}\n" for stack, count in self._stacks.items()]
+        try:
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            self.output_path.write_text("".join(lines), encoding="utf-8")
+        except OSError as e:
+            # Keep sampling; the stacks are written again on the next flush
+            self._logger.error(
+                "Could not write stack samples to %s: %s", self.output_path, e
+            )
+
+    def _run(self) -> None:
+        """Sampling loop."""
+        own_id = threading.get_ident()
+        flush_every = max(1, int(self.flush_interval / self.interval))
+        for tick in itertools.count(1):
+            if self._stop.wait(self.interval):
+                return
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            samples = [
+                _collapse(names.get(thread_id, str(thread_id)), frame)
+                for thread_id, frame in frames.items()
+                if thread_id != own_id
+            ]
+            with self._lock:
+                self._stacks.update(samples)
+            if tick % flush_every == 0:
+                self.flush()
+
+
+def _collapse(thread_name: str, frame: Optional[FrameType]) -> str:
+    """Render a frame chain as a semicolon separated root-first stack."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(reversed(parts))
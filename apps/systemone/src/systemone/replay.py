@@ -0,0 +1,163 @@
+"""Replay a SystemOne capture file against a running server."""
+
+import difflib
+import re
+import socket
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from systemone.capture import CapturedExchange, read_capture
+
+# Values that differ between runs even against the same seeded dataset
+_VOLATILE_FIELDS = re.compile(rb"<(ResponseUID|epoch)>[^<]*</\1>")
+
+
+@dataclass
+class ReplayResult:
+    """Outcome of replaying a single captured exchange."""
+
+    index: int
+    elapsed: float
+    matched: bool
+    diff: str = ""
+    error: Optional[str] = None
+
+
+@dataclass
+class ReplayReport:
+    """Summary of a capture replay."""
+
+    total: int = 0
+    mismatches: int = 0
+    errors: int = 0
+    wall_time: float = 0.0
+    results: list[ReplayResult] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Requests per second achieved during the replay."""
+        return self.total / self.wall_time if self.wall_time else 0.0
+
+
+def send_request(host: str, port: int, payload: bytes, timeout: float) -> bytes:
+    """Send one request to the server and return the raw response.
+
+    The server reads until the client half-closes the connection, so the
+    write side is shut down once the payload has been sent.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as client:
+        client.sendall(payload)
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def normalise_response(response: bytes) -> bytes:
+    """Mask values that differ on every run: ResponseUID and the epoch."""
+    return _VOLATILE_FIELDS.sub(rb"<\1/>", response)
+
+
+def diff_responses(expected: bytes, actual: bytes) -> str:
+    """Return a unified diff of two normalised responses."""
+    expected_lines = normalise_response(expected).decode("utf-8", "replace")
+    actual_lines = normalise_response(actual).decode("utf-8", "replace")
+    return "\n".join(
+        difflib.unified_diff(
+            expected_lines.splitlines(),
+            actual_lines.splitlines(),
+            fromfile="captured",
+            tofile="replayed",
+            lineterm="",
+        )
+    )
+
+
+def _replay_one(
+    index: int, exchange: CapturedExchange, host: str, port: int, timeout: float
+) -> ReplayResult:
+    """Send one captured request and compare the response."""
+    start = time.perf_counter()
+    try:
+        response = send_request(host, port, exchange.request, timeout)
+    except OSError as e:
+        return ReplayResult(
+            index=index,
+            elapsed=time.perf_counter() - start,
+            matched=False,
+            error=str(e),
+        )
+    elapsed = time.perf_counter() - start
+    if normalise_response(response) == normalise_response(exchange.response):
+        return ReplayResult(index=index, elapsed=elapsed, matched=True)
+    return ReplayResult(
+        index=index,
+        elapsed=elapsed,
+        matched=False,
+        diff=diff_responses(exchange.response, response),
+    )
+
+
+def replay_capture(
+    path: str,
+    host: str,
+    port: int,
+    speed: float = 1.0,
+    concurrency: int = 1,
+    timeout: float = 30.0,
+) -> ReplayReport:
+    """Replay a capture file and diff the responses.
+
+    Args:
+        path: Path of the capture file.
+        host: Server host.
+        port: Server port.
+        speed: Replay speed relative to the capture, e.g. ``1`` for real
+            time or ``10`` for ten times faster. ``0`` sends as fast as
+            possible.
+        concurrency: Number of connections that may be open at once.
+        timeout: Socket timeout in seconds for each request.
+
+    Returns:
+        A report with per-request results and overall throughput.
+    """
+    if speed < 0:
+        raise ValueError("speed must be zero or positive")
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    report = ReplayReport()
+    futures: list[Future] = []
+    first_received: Optional[float] = None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, exchange in enumerate(read_capture(path)):
+            if first_received is None:
+                first_received = exchange.received_at
+            if speed:
+                due = start + (exchange.received_at - first_received) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(
+                pool.submit(_replay_one, index, exchange, host, port, timeout)
+            )
+
+        for future in futures:
+            result = future.result()
+            report.results.append(result)
+            report.total += 1
+            if result.error is not None:
+                report.errors += 1
+            elif not result.matched:
+                report.mismatches += 1
+    report.wall_time = time.perf_counter() - start
+
+    return report
@@ -1,11 +1,14 @@
 import random
 import xml.etree.ElementTree as ET
+from contextlib import nullcontext
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from logging import getLogger
+from typing import Optional
 from uuid import UUID, uuid4
 
-from faker import Faker
+from systemone.datastore import DataStore
+from systemone.profiling import RequestProfiler
 
 
 @dataclass
@@ -41,7 +44,11 @@ class ClientIntegrationResponse:
 class SystemOne:
     """System One EPR Server."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        store: Optional[DataStore] = None,
+        profiler: Optional[RequestProfiler] = None,
+    ) -> None:
         self._list_available_functions: list[str] = [
             "GetFunctions",
             "GetOrganisationMetadata",
@@ -59,121 +66,19 @@ class SystemOne:
             "LaunchFunctionality",
             "GetXSDFiles",
             "IsPatientRetrieved",
+            "BulkUpdatePatientRecord",
+            "BulkDeleteFromPatientRecord",
         ]
+        self._function_names = {
+            name.lower(): name for name in self._list_available_functions
+        }
         self._clients: dict[UUID, list[tuple[UUID, UUID]]] = {}
         self._received_messages: dict[UUID, ClientIntegrationRequest] = {}
         self._processed_messages: dict[UUID, ClientIntegrationResponse] = {}
         self._logger = getLogger(__name__)
         self._device_id = "fake-device-id"
-        self._fake = Faker("en_GB")
-        self._patient_database = self._initialize_patient_database()
-        self._appointment_database = self._initialize_appointment_database()
-        self._document_database = self._initialize_document_database()
-
-    def _initialize_patient_database(self) -> dict:
-        """Initialize sample patient database."""
-        patients = {}
-        for i in range(20):
-            patient_id = f"P{100000 + i}"
-            patients[patient_id] = {
-                "patient_id": patient_id,
-                "first_name": self._fake.first_name(),
-                "last_name": self._fake.last_name(),
-                "date_of_birth": self._fake.date_of_birth(
-                    minimum_age=18, maximum_age=90
-                ).isoformat(),
-                "gender": random.choice(["M", "F", "U"]),  # nosec
-                "nhs_number": f"{random.randint(100000000, 999999999)}",  # nosec
-                "address": {
-                    "line1": self._fake.building_number()
-                    + " "
-                    + self._fake.street_name(),
-                    "line2": (
-                        self._fake.secondary_address()
-                        if random.choice([True, False])  # nosec
-                        else ""
-                    ),
-                    "city": self._fake.city(),
-                    "postcode": self._fake.postcode(),
-                },
-                "phone": self._fake.phone_number(),
-                "email": self._fake.email(),
-            }
-        return patients
-
-    def _initialize_appointment_database(self) -> dict:
-        """Initialize sample appointment database."""
-        appointments = {}
-        for i in range(50):
-            appointment_id = f"A{100000 + i}"
-            appointments[appointment_id] = {
-                "appointment_id": appointment_id,
-                "patient_id": f"P{100000 + random.randint(0, 19)}",  # nosec
-                "appointment_type": random.choice(
-                    [
-                        "GP_CONSULTATION",
-                        "SPECIALIST_REFERRAL",
-                        "BLOOD_TEST",
-                        "VACCINATION",
-                        "REVIEW",
-                    ]
-                ),  # nosec
-                "scheduled_time": (
-                    datetime.now()
-                    + timedelta(
-                        days=random.randint(1, 30),  # nosec
-                        hours=random.randint(9, 17),  # nosec
-                    )
-                ).isoformat(),
-                "duration_minutes": random.choice([15, 20, 30, 45, 60]),  # nosec
-                "status": random.choice(
-                    ["SCHEDULED", "CONFIRMED", "CANCELLED", "COMPLETED", "NO_SHOW"]
-                ),  # nosec
-                "location": random.choice(
-                    ["Main Surgery", "Branch Surgery", "Community Clinic", "Hospital"]
-                ),  # nosec
-                "clinician_id": f"CLIN{random.randint(1000, 9999)}",  # nosec
-                "notes": random.choice(
-                    [
-                        "Regular check-up",
-                        "Follow-up appointment",
-                        "New patient consultation",
-                        "Annual review",
-                    ]
-                ),  # nosec
-            }
-        return appointments
-
-    def _initialize_document_database(self) -> dict:
-        """Initialize sample document database."""
-        documents = {}
-        for i in range(30):
-            doc_id = f"DOC{100000 + i}"
-            documents[doc_id] = {
-                "document_id": doc_id,
-                "patient_id": f"P{100000 + random.randint(0, 19)}",  # nosec
-                "document_type": random.choice(
-                    ["CONSULTATION", "LETTER", "REPORT", "PRESCRIPTION", "LAB_RESULT"]
-                ),  # nosec
-                "title": random.choice(
-                    [
-                        "Consultation Notes",
-                        "Referral Letter",
-                        "Lab Report",
-                        "Prescription",
-                        "Discharge Summary",
-                    ]
-                ),  # nosec
-                "content": self._fake.text(max_nb_chars=500),
-                "created_date": (
-                    datetime.now() - timedelta(days=random.randint(1, 365))  # nosec
-                ).isoformat(),
-                "author": f"Dr. {self._fake.last_name()}",
-                "status": random.choice(
-                    ["DRAFT", "FINAL", "SENT", "ARCHIVED"]
-                ),  # nosec
-            }
-        return documents
+        self._profiler = profiler
+        self._store = store if store is not None else DataStore()
 
     def _parse_xml_request(self, xml_data: str) -> ClientIntegrationRequest:
         """Parse XML request into ClientIntegrationRequest dataclass."""
@@ -213,7 +118,14 @@ class SystemOne:
         function_params_elem = root.find("FunctionParameters")
         if function_params_elem is not None:
             for child in function_params_elem:
-                function_parameters[child.tag] = child.text
+                if child.tag == "Records":
+                    # Bulk functions take a list of records, e.g.
+                    # <Records><Record><PatientID>...</Record></Records>
+                    function_parameters[child.tag] = [
+                        {field.tag: field.text for field in item} for item in child
+                    ]
+                else:
+                    function_parameters[child.tag] = child.text
 
         return ClientIntegrationRequest(
             api_key=api_key,
@@ -263,6 +175,12 @@ class SystemOne:
                 return self._get_xsd_files()
             case "ispatientretrieved":
                 return self._is_patient_retrieved(request.fucntion_parameters)
+            case "bulkupdatepatientrecord":
+                return self._bulk_update_patient_record(request.fucntion_parameters)
+            case "bulkdeletefrompatientrecord":
+                return self._bulk_delete_from_patient_record(
+                    request.fucntion_parameters
+                )
             case _:
                 return {"error": f"Unknown function: {request.function_name}"}
 
@@ -281,7 +199,12 @@ class SystemOne:
 
     def _get_organisation_metadata(self) -> dict:
         """Get organisation metadata."""
-        return {"organisation": {"name": "System One Test Practice", "code": "TEST001"}}
+        return {
+            "organisation": {
+                "name": self._store.organisation_name,
+                "code": self._store.organisation_code,
+            }
+        }
 
     def _get_current_activity(self) -> dict:
         """Get current activity information."""
@@ -316,7 +239,7 @@ class SystemOne:
         search_term = params.get("SearchTerm", "")
         patients = []
 
-        for patient_id, patient_data in self._patient_database.items():
+        for patient_id, patient_data in self._store.patients.items():
             if (
                 search_term.lower() in patient_data["first_name"].lower()
                 or search_term.lower() in patient_data["last_name"].lower()
@@ -334,19 +257,11 @@ class SystemOne:
         """Get specific patient record."""
         patient_id = params.get("PatientID", "")
 
-        if patient_id in self._patient_database:
-            patient = self._patient_database[patient_id]
+        if patient_id in self._store.patients:
+            patient = self._store.patients[patient_id]
             # Add related appointments and documents
-            appointments = [
-                apt
-                for apt in self._appointment_database.values()
-                if apt["patient_id"] == patient_id
-            ]
-            documents = [
-                doc
-                for doc in self._document_database.values()
-                if doc["patient_id"] == patient_id
-            ]
+            appointments = self._store.patient_appointments(patient_id)
+            documents = self._store.patient_documents(patient_id)
 
             return {
                 "patient": patient,
@@ -365,12 +280,12 @@ class SystemOne:
         """Update patient record."""
         patient_id = params.get("PatientID", "")
 
-        if patient_id in self._patient_database:
-            # Update patient data
-            for key, value in params.items():
-                if key != "PatientID" and key in self._patient_database[patient_id]:
-                    self._patient_database[patient_id][key] = value
-
+        fields = {key: value for key, value in params.items() if key != "PatientID"}
+        try:
+            found = self._store.update_patient(patient_id, fields)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        if found:
             return {
                 "success": True,
                 "patient_id": patient_id,
@@ -383,8 +298,8 @@ class SystemOne:
         """Get document by ID."""
         document_id = params.get("DocumentID", "")
 
-        if document_id in self._document_database:
-            return {"document": self._document_database[document_id], "found": True}
+        if document_id in self._store.documents:
+            return {"document": self._store.documents[document_id], "found": True}
         else:
             return {
                 "document": None,
@@ -398,11 +313,11 @@ class SystemOne:
         item_type = params.get("ItemType", "")
         item_id = params.get("ItemID", "")
 
-        if patient_id in self._patient_database:
-            if item_type == "APPOINTMENT" and item_id in self._appointment_database:
-                del self._appointment_database[item_id]
-            elif item_type == "DOCUMENT" and item_id in self._document_database:
-                del self._document_database[item_id]
+        if patient_id in self._store.patients:
+            if item_type == "APPOINTMENT":
+                self._store.delete_appointment(item_id)
+            elif item_type == "DOCUMENT":
+                self._store.delete_document(item_id)
 
             return {
                 "success": True,
@@ -445,7 +360,7 @@ class SystemOne:
 
         # Get appointments for the specified date and clinician
         diary_entries = []
-        for appointment in self._appointment_database.values():
+        for appointment in self._store.appointments.values():
             if appointment["clinician_id"] == clinician_id and appointment[
                 "scheduled_time"
             ].startswith(date):
@@ -468,19 +383,39 @@ class SystemOne:
         date_from = params.get("DateFrom", "")
         date_to = params.get("DateTo", "")
 
-        extracted_data = []
-        if extract_type == "PATIENTS":
-            extracted_data = list(self._patient_database.values())
-        elif extract_type == "APPOINTMENTS":
-            extracted_data = list(self._appointment_database.values())
-        elif extract_type == "DOCUMENTS":
-            extracted_data = list(self._document_database.values())
+        since_version = params.get("SinceVersion")
+        since_epoch = params.get("Epoch")
+
+        # A watermark without this store's epoch, or ahead of it, may come
+        # from a regenerated store; the client gets a full extract instead.
+        full_resync = False
+        if since_version is not None:
+            try:
+                watermark = int(since_version)
+            except ValueError:
+                return {"error": f"Invalid SinceVersion: {since_version}"}
+            full_resync = not self._store.is_current_watermark(watermark, since_epoch)
+
+        extracted_data: list[dict] = []
+        deleted_records: list[dict] = []
+        if since_version is not None and not full_resync:
+            if extract_type in self._store.tables:
+                extracted_data, deleted_records = self._store.changes_since(
+                    extract_type, watermark
+                )
+        elif extract_type in self._store.tables:
+            extracted_data = list(self._store.tables[extract_type].values())
 
         return {
             "extract_type": extract_type,
             "date_from": date_from,
             "date_to": date_to,
+            "since_version": since_version if since_version is not None else "",
+            "epoch": self._store.epoch,
+            "current_version": self._store.version,
+            "full_resync": full_resync,
             "extracted_data": extracted_data,
+            "deleted_records": deleted_records,
             "record_count": len(extracted_data),
         }
 
@@ -518,14 +453,57 @@ class SystemOne:
 
         return {
             "patient_id": patient_id,
-            "is_retrieved": patient_id in self._patient_database,
+            "is_retrieved": patient_id in self._store.patients,
             "retrieval_time": (
                 datetime.now().isoformat()
-                if patient_id in self._patient_database
+                if patient_id in self._store.patients
                 else None
             ),
         }
 
+    def _bulk_records(self, params: dict) -> list[dict]:
+        """Get the list of records from bulk function parameters."""
+        records = params.get("Records")
+        return records if isinstance(records, list) else []
+
+    def _bulk_result(self, item_ids: list[str], statuses: list[str]) -> dict:
+        """Summarise the per-item statuses of a bulk function."""
+        success = all(status == "OK" for status in statuses)
+        return {
+            "success": success,
+            "applied": len(statuses) if success else 0,
+            "current_version": self._store.version,
+            "results": [
+                {"index": index, "id": item_id, "status": status}
+                for index, (item_id, status) in enumerate(zip(item_ids, statuses))
+            ],
+        }
+
+    def _bulk_update_patient_record(self, params: dict) -> dict:
+        """Update many patient records atomically."""
+        updates = [
+            (
+                record.get("PatientID") or "",
+                {key: value for key, value in record.items() if key != "PatientID"},
+            )
+            for record in self._bulk_records(params)
+        ]
+        statuses = self._store.update_patients(updates)
+        return self._bulk_result([patient_id for patient_id, _ in updates], statuses)
+
+    def _bulk_delete_from_patient_record(self, params: dict) -> dict:
+        """Delete many items from patient records atomically."""
+        items = [
+            (
+                record.get("PatientID") or "",
+                record.get("ItemType") or "",
+                record.get("ItemID") or "",
+            )
+            for record in self._bulk_records(params)
+        ]
+        statuses = self._store.delete_items(items)
+        return self._bulk_result([item_id for _, _, item_id in items], statuses)
+
     def _create_response_xml(
         self, request: ClientIntegrationRequest, response_data: dict
     ) -> str:
@@ -595,15 +573,24 @@ class SystemOne:
                 request.request_uid,
             )
 
-            # Execute the requested function
-            response_data = self._execute_function(request)
-            self._logger.info(
-                "Function %s executed successfully", request.function_name
+            # Only known functions are profiled, under their canonical name,
+            # so the client's text never reaches a profile file name.
+            function_name = self._function_names.get(request.function_name.lower())
+            profiling = (
+                self._profiler.profile(function_name)
+                if self._profiler is not None and function_name is not None
+                else nullcontext()
             )
-
-            # Create XML response
-            response_xml = self._create_response_xml(request, response_data)
-            self._logger.info("Response generated successfully")
+            with profiling, self._store.lock:
+                # Execute the requested function
+                response_data = self._execute_function(request)
+                self._logger.info(
+                    "Function %s executed successfully", request.function_name
+                )
+
+                # Create XML response
+                response_xml = self._create_response_xml(request, response_data)
+                self._logger.info("Response generated successfully")
 
             return response_xml
 
@@ -0,0 +1,249 @@
+"""Multi-practice tenancy for the SystemOne simulator.
+
+A ``PracticeRouter`` owns one ``SystemOne`` shard per practice (ODS code).
+Requests are routed to a shard by their ``DeviceID``. Shards are created on
+first use from a seeded ``DataStore`` and the least recently used shards are
+evicted when the estimated size of the loaded datasets, including their
+indexes and change logs, exceeds the memory budget. A shard's size is
+estimated once when it is loaded and then grows by a fixed amount per
+change-log entry, so writes never walk the dataset. An evicted shard
+is regenerated from its seed when next used, so changes made through update
+or delete functions are lost on eviction.
+"""
+
+import json
+import re
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Any, Iterable, Optional
+from uuid import uuid4
+from xml.sax.saxutils import unescape
+
+from systemone.datastore import DataStore
+from systemone.profiling import RequestProfiler
+from systemone.systemone import SystemOne
+
+
+_DEVICE_ID = re.compile(rb"<DeviceID>([^<]*)</DeviceID>")
+# A change-log entry: the list slot, the (version, table, id) tuple and the
+# version int. The table and record id strings are shared with the records.
+_CHANGE_LOG_ENTRY_SIZE = 8 + sys.getsizeof((0, "", "")) + sys.getsizeof(2**40)
+
+
+@dataclass
+class PracticeConfig:
+    """Configuration for a single simulated practice."""
+
+    code: str
+    name: str
+    seed: int
+    device_ids: list[str] = field(default_factory=list)
+
+
+def generate_practices(count: int) -> list[PracticeConfig]:
+    """Generate ``count`` synthetic practices.
+
+    Practice ``n`` has ODS code ``TEST{n:03d}``, seed ``n`` and accepts
+    requests from device ``device-TEST{n:03d}``.
+    """
+    practices = []
+    for number in range(1, count + 1):
+        code = f"TEST{number:03d}"
+        practices.append(
+            PracticeConfig(
+                code=code,
+                name=f"System One Test Practice {number}",
+                seed=number,
+                device_ids=[f"device-{code}"],
+            )
+        )
+    return practices
+
+
+def load_practices(path: str) -> list[PracticeConfig]:
+    """Load practice definitions from a JSON file.
+
+    The file holds a list of objects with ``code``, ``name``, ``seed`` and
+    ``device_ids`` keys.
+    """
+    with open(path, encoding="utf-8") as handle:
+        entries = json.load(handle)
+    return [PracticeConfig(**entry) for entry in entries]
+
+
+def _estimate_size(value: Any) -> int:
+    """Estimate the memory used by a tree of dicts, lists and scalars."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_estimate_size(item) for item in value)
+    return size
+
+
+def _estimate_store_size(store: DataStore) -> int:
+    """Estimate the memory used by a store's tables, indexes and change log."""
+    return _estimate_size(
+        [
+            store.patients,
+            store.appointments,
+            store.documents,
+            store.appointments_by_patient,
+            store.documents_by_patient,
+            store.change_log,
+        ]
+    )
+
+
+@dataclass
+class _Shard:
+    """A loaded practice and its estimated size as of ``sized_version``."""
+
+    system_one: SystemOne
+    store: DataStore
+    size: int
+    sized_version: int
+
+
+class PracticeRouter:
+    """Route requests to per-practice SystemOne shards."""
+
+    def __init__(
+        self,
+        practices: Iterable[PracticeConfig],
+        memory_budget_mb: float = 256.0,
+        profiler: Optional[RequestProfiler] = None,
+    ) -> None:
+        self._practices: dict[str, PracticeConfig] = {}
+        self._device_routes: dict[str, str] = {}
+        for practice in practices:
+            self._practices[practice.code] = practice
+            for device_id in practice.device_ids:
+                self._device_routes[device_id] = practice.code
+        self._memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._profiler = profiler
+        self._shards: OrderedDict[str, _Shard] = OrderedDict()
+        self._total_size = 0
+        # Guards the shard table only; shards are built outside it under a
+        # per-practice lock so concurrent callers loading different
+        # practices do not wait for each other.
+        self._lock = threading.Lock()
+        self._loading: dict[str, threading.Lock] = {}
+        self._logger = getLogger(__name__)
+
+    @property
+    def loaded_practices(self) -> list[str]:
+        """ODS codes of the shards currently in memory."""
+        with self._lock:
+            return list(self._shards)
+
+    def shard_for_device(self, device_id: str) -> Optional[SystemOne]:
+        """Return the shard serving ``device_id``, loading it if needed."""
+        code = self._device_routes.get(device_id)
+        if code is None:
+            return None
+        return self._shard(code).system_one
+
+    def _shard(self, code: str) -> _Shard:
+        """Return the loaded shard for a practice, loading it if needed."""
+        with self._lock:
+            shard = self._cached_shard(code)
+            if shard is not None:
+                return shard
+            loading = self._loading.setdefault(code, threading.Lock())
+
+        with loading:
+            # Another request may have loaded the practice while we waited
+            with self._lock:
+                shard = self._cached_shard(code)
+                if shard is not None:
+                    return shard
+
+            shard = self._load_shard(self._practices[code])
+            with self._lock:
+                self._shards[code] = shard
+                self._total_size += shard.size
+                self._loading.pop(code, None)
+                self._evict_over_budget()
+            return shard
+
+    def _cached_shard(self, code: str) -> Optional[_Shard]:
+        """Return a loaded shard and mark it most recently used."""
+        shard = self._shards.get(code)
+        if shard is not None:
+            self._shards.move_to_end(code)
+        return shard
+
+    def _load_shard(self, practice: PracticeConfig) -> _Shard:
+        """Create the dataset and SystemOne instance for a practice."""
+        store = DataStore(
+            organisation_name=practice.name,
+            organisation_code=practice.code,
+            seed=practice.seed,
+        )
+        shard = _Shard(
+            system_one=SystemOne(store=store, profiler=self._profiler),
+            store=store,
+            size=_estimate_store_size(store),
+            sized_version=store.version,
+        )
+        self._logger.info("Loaded practice %s", practice.code)
+        return shard
+
+    def _record_growth(self, code: str, shard: _Shard) -> None:
+        """Grow a shard's size by its new change-log entries and evict.
+
+        Only the change log is accounted for; updated field values and
+        deleted records are not, so the estimate errs on the high side.
+        """
+        with self._lock:
+            version = shard.store.version
+            growth = (version - shard.sized_version) * _CHANGE_LOG_ENTRY_SIZE
+            shard.size += growth
+            shard.sized_version = version
+            # The shard may have been evicted while the request ran
+            if self._shards.get(code) is shard:
+                self._total_size += growth
+                self._evict_over_budget()
+
+    def _evict_over_budget(self) -> None:
+        """Evict least recently used shards until within the memory budget."""
+        while len(self._shards) > 1 and self._total_size > self._memory_budget:
+            code, shard = self._shards.popitem(last=False)
+            self._total_size -= shard.size
+            self._logger.info("Evicted practice %s", code)
+
+    def handle(self, request_data: bytes) -> str:
+        """Route a request to its practice shard.
+
+        Args:
+            request_data: The raw bytes of the request data.
+
+        Returns:
+            The XML string response.
+        """
+        # The shard parses the request, so only scan for the DeviceID here
+        match = _DEVICE_ID.search(request_data)
+        device_id = unescape(match.group(1).decode("utf-8", "replace")) if match else ""
+        code = self._device_routes.get(device_id)
+        if code is None:
+            self._logger.error("No practice configured for DeviceID %s", device_id)
+            return self._error_response(f"Unknown DeviceID: {device_id}")
+
+        shard = self._shard(code)
+        response = shard.system_one.handle(request_data)
+        if shard.store.version != shard.sized_version:
+            self._record_growth(code, shard)
+        return response
+
+    def _error_response(self, message: str) -> str:
+        """Build an error response for requests that cannot be routed."""
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<ClientIntegrationResponse>
+    <Error>true</Error>
+    <ErrorMessage>{message}</ErrorMessage>
+    <ResponseUID>{str(uuid4()).upper()}</ResponseUID>
+</ClientIntegrationResponse>"""
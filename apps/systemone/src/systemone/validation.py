@@ -0,0 +1,109 @@
+"""XSD validation of ClientIntegration messages.
+
+The schemas are compiled once when the validator is created and reused for
+every message. Validation can be sampled so that only one in every N
+exchanges is checked.
+"""
+
+import itertools
+import threading
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+
+from lxml import etree
+
+SCHEMA_DIR = Path(__file__).parent / "schemas"
+REQUEST_SCHEMA = SCHEMA_DIR / "ClientIntegrationRequest.xsd"
+RESPONSE_SCHEMA = SCHEMA_DIR / "ClientIntegrationResponse.xsd"
+
+
+@dataclass
+class ValidationStats:
+    """Counts of validated and invalid messages."""
+
+    requests_validated: int = 0
+    requests_invalid: int = 0
+    responses_validated: int = 0
+    responses_invalid: int = 0
+
+
+class MessageValidator:
+    """Validate requests and responses against the ClientIntegration XSDs."""
+
+    def __init__(
+        self,
+        validate_requests: bool = True,
+        validate_responses: bool = True,
+        sample_rate: int = 1,
+    ) -> None:
+        if sample_rate < 1:
+            raise ValueError("sample_rate must be at least 1")
+        self.validate_requests = validate_requests
+        self.validate_responses = validate_responses
+        self.sample_rate = sample_rate
+        self.stats = ValidationStats()
+        self._parser = etree.XMLParser(resolve_entities=False, no_network=True)
+        self._request_schema = etree.XMLSchema(
+            etree.parse(str(REQUEST_SCHEMA), self._parser)
+        )
+        self._response_schema = etree.XMLSchema(
+            etree.parse(str(RESPONSE_SCHEMA), self._parser)
+        )
+        self._counter = itertools.count(1)
+        # lxml parsers and schemas must not be used by two threads at once
+        self._lock = threading.Lock()
+        self._logger = getLogger(__name__)
+
+    def sample(self) -> bool:
+        """Return whether the next exchange should be validated."""
+        return next(self._counter) % self.sample_rate == 0
+
+    def check_request(self, request_data: bytes) -> list[str]:
+        """Validate a raw request.
+
+        Args:
+            request_data: The raw bytes of the request.
+
+        Returns:
+            Validation errors, empty if the request is valid or request
+            validation is disabled.
+        """
+        if not self.validate_requests:
+            return []
+        errors = self._validate(self._request_schema, request_data)
+        self.stats.requests_validated += 1
+        if errors:
+            self.stats.requests_invalid += 1
+            self._logger.warning("Invalid request: %s", "; ".join(errors))
+        return errors
+
+    def check_response(self, response_data: bytes) -> list[str]:
+        """Validate a raw response.
+
+        Args:
+            response_data: The raw bytes of the response.
+
+        Returns:
+            Validation errors, empty if the response is valid or response
+            validation is disabled.
+        """
+        if not self.validate_responses:
+            return []
+        errors = self._validate(self._response_schema, response_data)
+        self.stats.responses_validated += 1
+        if errors:
+            self.stats.responses_invalid += 1
+            self._logger.warning("Invalid response: %s", "; ".join(errors))
+        return errors
+
+    def _validate(self, schema: etree.XMLSchema, data: bytes) -> list[str]:
+        """Parse and validate a document, returning any errors."""
+        with self._lock:
+            try:
+                document = etree.fromstring(data, self._parser)
+            except etree.XMLSyntaxError as e:
+                return [f"Invalid XML: {e}"]
+            if schema.validate(document):
+                return []
+            return [f"line {error.line}: {error.message}" for error in schema.error_log]
@@ -0,0 +1,68 @@
+"""Tests for the binary capture log."""
+
+from pathlib import Path
+
+import pytest
+from systemone.capture import CAPTURE_MAGIC, CaptureWriter, read_capture
+
+
+def _write(path: Path, exchanges: list[tuple[bytes, bytes]]) -> None:
+    """Write request/response pairs to a capture file."""
+    writer = CaptureWriter(str(path))
+    for number, (request, response) in enumerate(exchanges):
+        writer.write(1000.0 + number, 0.25, request, response)
+    writer.close()
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    """Exchanges are read back in order with their timings."""
+    path = tmp_path / "traffic.cap"
+    _write(path, [(b"<a/>", b"<b/>"), (b"", b"<empty request/>")])
+
+    exchanges = list(read_capture(str(path)))
+
+    assert [(e.request, e.response) for e in exchanges] == [
+        (b"<a/>", b"<b/>"),
+        (b"", b"<empty request/>"),
+    ]
+    assert [e.received_at for e in exchanges] == [1000.0, 1001.0]
+    assert all(e.elapsed == 0.25 for e in exchanges)
+
+
+def test_reopening_appends_without_second_header(tmp_path: Path) -> None:
+    """A second writer on the same file appends to the existing records."""
+    path = tmp_path / "traffic.cap"
+    _write(path, [(b"1", b"one")])
+    _write(path, [(b"2", b"two")])
+
+    assert path.read_bytes().count(CAPTURE_MAGIC) == 1
+    assert [e.response for e in read_capture(str(path))] == [b"one", b"two"]
+
+
+def test_rejects_other_files(tmp_path: Path) -> None:
+    """Files without the capture header are neither read nor appended to."""
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a capture")
+
+    with pytest.raises(ValueError, match="not a SystemOne capture file"):
+        list(read_capture(str(path)))
+    with pytest.raises(ValueError, match="not a SystemOne capture file"):
+        CaptureWriter(str(path))
+
+
+@pytest.mark.parametrize(
+    ("kept", "message"),
+    [(10, "Truncated record header"), (30, "Truncated record body")],
+)
+def test_truncated_records(tmp_path: Path, kept: int, message: str) -> None:
+    """A record cut short raises after the complete records are yielded."""
+    path = tmp_path / "traffic.cap"
+    _write(path, [(b"request-1", b"response-1")])
+    complete = path.stat().st_size
+    _write(path, [(b"request-2", b"response-2")])
+    path.write_bytes(path.read_bytes()[: complete + kept])
+
+    exchanges = read_capture(str(path))
+    assert next(exchanges).request == b"request-1"
+    with pytest.raises(ValueError, match=message):
+        next(exchanges)
@@ -0,0 +1,198 @@
+"""Tests for batch mutations and delta extracts on the DataStore."""
+
+import copy
+
+import pytest
+from systemone.datastore import DataStore
+
+
+@pytest.fixture
+def store() -> DataStore:
+    """A small seeded practice dataset."""
+    return DataStore(seed=1)
+
+
+def _snapshot(store: DataStore) -> dict:
+    """Copy everything a failed batch must leave untouched."""
+    return copy.deepcopy(
+        {
+            "tables": store.tables,
+            "appointments_by_patient": dict(store.appointments_by_patient),
+            "documents_by_patient": dict(store.documents_by_patient),
+            "version": store.version,
+            "change_log": store.change_log,
+        }
+    )
+
+
+def test_update_patients_with_unknown_patient_applies_nothing(
+    store: DataStore,
+) -> None:
+    """A batch with one unknown patient leaves the store unchanged."""
+    before = _snapshot(store)
+
+    statuses = store.update_patients(
+        [("P100001", {"phone": "01234 567890"}), ("P999999", {"phone": "0"})]
+    )
+
+    assert statuses == ["NOT_APPLIED", "NOT_FOUND"]
+    assert _snapshot(store) == before
+
+
+def test_delete_items_with_invalid_item_deletes_nothing(store: DataStore) -> None:
+    """A batch with any invalid item leaves tables and indexes unchanged."""
+    appointment = store.appointments["A100000"]
+    before = _snapshot(store)
+
+    statuses = store.delete_items(
+        [
+            (appointment["patient_id"], "APPOINTMENT", "A100000"),
+            (appointment["patient_id"], "DOCUMENT", "DOC999999"),
+            ("P999999", "DOCUMENT", "DOC100000"),
+            (appointment["patient_id"], "PRESCRIPTION", "A100001"),
+        ]
+    )
+
+    assert statuses == [
+        "NOT_APPLIED",
+        "NOT_FOUND",
+        "PATIENT_NOT_FOUND",
+        "INVALID_TYPE",
+    ]
+    assert _snapshot(store) == before
+
+
+def test_delete_items_rejects_duplicate_item_ids(store: DataStore) -> None:
+    """The second delete of the same item in one batch is NOT_FOUND."""
+    patient_id = store.appointments["A100000"]["patient_id"]
+    before = _snapshot(store)
+
+    statuses = store.delete_items(
+        [
+            (patient_id, "APPOINTMENT", "A100000"),
+            (patient_id, "APPOINTMENT", "A100000"),
+        ]
+    )
+
+    assert statuses == ["NOT_APPLIED", "NOT_FOUND"]
+    assert _snapshot(store) == before
+
+
+def test_update_patients_with_invalid_field_applies_nothing(
+    store: DataStore,
+) -> None:
+    """A value of the wrong type for a field fails the whole batch."""
+    before = _snapshot(store)
+
+    statuses = store.update_patients(
+        [("P100001", {"phone": "01234 567890"}), ("P100002", {"address": "x"})]
+    )
+
+    assert statuses == ["NOT_APPLIED", "INVALID_FIELD"]
+    assert _snapshot(store) == before
+
+
+def test_update_patient_rejects_invalid_field(store: DataStore) -> None:
+    """A single update with a value of the wrong type changes nothing."""
+    before = _snapshot(store)
+
+    with pytest.raises(ValueError, match="address"):
+        store.update_patient("P100001", {"phone": "1", "address": None})
+
+    assert _snapshot(store) == before
+
+
+def test_delete_items_rejects_item_of_another_patient(store: DataStore) -> None:
+    """An item is only deleted through the patient it belongs to."""
+    appointment = store.appointments["A100000"]
+    other_patient = next(
+        patient_id
+        for patient_id in store.patients
+        if patient_id != appointment["patient_id"]
+    )
+    before = _snapshot(store)
+
+    statuses = store.delete_items([(other_patient, "APPOINTMENT", "A100000")])
+
+    assert statuses == ["NOT_FOUND"]
+    assert _snapshot(store) == before
+
+
+def test_update_patients_with_duplicate_ids_logs_one_change(
+    store: DataStore,
+) -> None:
+    """Repeated updates of one patient apply in order as a single change."""
+    statuses = store.update_patients(
+        [("P100001", {"phone": "first"}), ("P100001", {"phone": "second"})]
+    )
+
+    assert statuses == ["OK", "OK"]
+    assert store.patients["P100001"]["phone"] == "second"
+    assert store.change_log == [(1, "PATIENTS", "P100001")]
+    assert store.patients["P100001"]["version"] == store.version == 1
+
+
+def test_delete_items_updates_indexes(store: DataStore) -> None:
+    """Deleted items are removed from the tables and patient indexes."""
+    appointment = store.appointments["A100000"]
+    document = store.documents["DOC100000"]
+
+    statuses = store.delete_items(
+        [
+            (appointment["patient_id"], "APPOINTMENT", "A100000"),
+            (document["patient_id"], "DOCUMENT", "DOC100000"),
+        ]
+    )
+
+    assert statuses == ["OK", "OK"]
+    assert "A100000" not in store.appointments
+    assert "DOC100000" not in store.documents
+    assert "A100000" not in store.appointments_by_patient[appointment["patient_id"]]
+    assert "DOC100000" not in store.documents_by_patient[document["patient_id"]]
+    assert store.version == 2
+
+
+def test_changes_since_returns_updates_and_tombstones(store: DataStore) -> None:
+    """A delta holds records changed after the watermark and tombstones."""
+    store.update_patient("P100000", {"phone": "before watermark"})
+    watermark = store.version
+    store.delete_items(
+        [
+            (
+                store.appointments[appointment_id]["patient_id"],
+                "APPOINTMENT",
+                appointment_id,
+            )
+            for appointment_id in ["A100000", "A100001"]
+        ]
+    )
+    store.update_patients([("P100001", {"phone": "after watermark"})])
+    store.update_patient("P100002", {"email": "first@example.com"})
+    store.update_patient("P100002", {"email": "second@example.com"})
+
+    patients, deleted_patients = store.changes_since("PATIENTS", watermark)
+    appointments, deleted_appointments = store.changes_since("APPOINTMENTS", watermark)
+
+    assert [patient["patient_id"] for patient in patients] == ["P100001", "P100002"]
+    assert patients[1]["email"] == "second@example.com"
+    assert deleted_patients == []
+    assert appointments == []
+    assert deleted_appointments == [
+        {"record_id": "A100000", "version": 2},
+        {"record_id": "A100001", "version": 3},
+    ]
+
+    _, deleted_since_start = store.changes_since("APPOINTMENTS", 0)
+    assert len(deleted_since_start) == 2
+    assert store.changes_since("PATIENTS", store.version) == ([], [])
+
+
+def test_is_current_watermark_rejects_other_epochs(store: DataStore) -> None:
+    """Watermarks without this epoch or ahead of the store need a resync."""
+    store.update_patient("P100000", {"phone": "1"})
+
+    assert store.is_current_watermark(1, store.epoch)
+    assert store.is_current_watermark(0, store.epoch)
+    assert not store.is_current_watermark(0, None)
+    assert not store.is_current_watermark(2, store.epoch)
+    assert not store.is_current_watermark(1, DataStore(seed=1).epoch)
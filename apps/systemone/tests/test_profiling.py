@@ -0,0 +1,129 @@
+"""Tests for request profiling and stack sampling."""
+
+import logging
+import time
+from pathlib import Path
+
+import pytest
+from systemone.datastore import DataStore
+from systemone.profiling import RequestProfiler, StackSampler
+from systemone.systemone import SystemOne
+
+
+def _request(function: str) -> bytes:
+    """Build a minimal request for a function."""
+    return (
+        "<ClientIntegrationRequest><APIKey>fake-api-key</APIKey>"
+        f"<DeviceID>d</DeviceID><RequestUID>u</RequestUID><Function>{function}"
+        "</Function></ClientIntegrationRequest>"
+    ).encode()
+
+
+def _profiles(directory: Path) -> list[str]:
+    """Names of the profile files written under a directory."""
+    return sorted(path.name for path in directory.rglob("*.prof"))
+
+
+def test_disabled_profiler_writes_nothing(tmp_path: Path) -> None:
+    """Nothing is profiled until profiling is enabled."""
+    profiler = RequestProfiler(str(tmp_path))
+    with profiler.profile("GetFunctions"):
+        pass
+    assert _profiles(tmp_path) == []
+
+    assert profiler.toggle() is True
+    with profiler.profile("GetFunctions"):
+        pass
+    assert _profiles(tmp_path) == ["GetFunctions-1.prof"]
+
+
+def test_samples_every_nth_matching_request(tmp_path: Path) -> None:
+    """Only every Nth request for the selected functions is profiled."""
+    profiler = RequestProfiler(
+        str(tmp_path), every_n=2, function_names=["getdiary"], enabled=True
+    )
+    for function in ["GetDiary", "GetFunctions", "GetDiary", "GetDiary"]:
+        with profiler.profile(function):
+            pass
+
+    assert _profiles(tmp_path) == ["GetDiary-1.prof"]
+
+
+def test_rejects_invalid_sample_rate() -> None:
+    """every_n must be at least one."""
+    with pytest.raises(ValueError):
+        RequestProfiler("profiles", every_n=0)
+
+
+def test_file_names_stay_inside_output_dir(tmp_path: Path) -> None:
+    """Path separators in a function name cannot escape the output dir."""
+    output_dir = tmp_path / "profiles"
+    profiler = RequestProfiler(str(output_dir), enabled=True)
+    with profiler.profile("../x/evil"):
+        pass
+
+    assert [path.name for path in tmp_path.rglob("*.prof")] == ["___x_evil-1.prof"]
+    assert (output_dir / "___x_evil-1.prof").exists()
+
+
+def test_dump_failure_is_logged(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    """A profile that cannot be written does not fail the request."""
+    blocker = tmp_path / "profiles"
+    blocker.write_text("not a directory")
+    profiler = RequestProfiler(str(blocker), enabled=True)
+
+    with caplog.at_level(logging.ERROR), profiler.profile("GetFunctions"):
+        pass
+
+    assert "Could not write profile" in caplog.text
+
+
+def test_systemone_profiles_known_functions_by_canonical_name(
+    tmp_path: Path,
+) -> None:
+    """Known functions use their listed name; unknown ones are not profiled."""
+    profiler = RequestProfiler(str(tmp_path), enabled=True)
+    system_one = SystemOne(store=DataStore(seed=1), profiler=profiler)
+
+    system_one.handle(_request("getfunctions"))
+    response = system_one.handle(_request("a/b"))
+
+    assert _profiles(tmp_path) == ["GetFunctions-1.prof"]
+    assert "Unknown function: a/b" in response
+
+
+def test_stack_sampler_writes_collapsed_stacks(tmp_path: Path) -> None:
+    """Samples are written as semicolon separated stacks with counts."""
+    output = tmp_path / "stacks.folded"
+    sampler = StackSampler(str(output), interval=0.001)
+
+    assert sampler.toggle() is True
+    time.sleep(0.05)
+    assert sampler.toggle() is False
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert ";" in stack and int(count) > 0
+
+
+def test_stack_sampler_survives_unwritable_output(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Flush failures are logged and neither stop nor crash the sampler."""
+    blocker = tmp_path / "profiles"
+    blocker.write_text("not a directory")
+    sampler = StackSampler(
+        str(blocker / "stacks.folded"), interval=0.001, flush_interval=0.002
+    )
+
+    with caplog.at_level(logging.ERROR):
+        sampler.start()
+        time.sleep(0.05)
+        assert sampler.running
+        sampler.stop()
+
+    assert not sampler.running
+    assert "Could not write stack samples" in caplog.text
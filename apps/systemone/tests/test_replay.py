@@ -0,0 +1,114 @@
+"""Tests for replaying captures and diffing responses."""
+
+import socketserver
+import threading
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from systemone.capture import CaptureWriter
+from systemone.replay import diff_responses, normalise_response, replay_capture
+
+
+def _response(body: str, uid: str) -> bytes:
+    """Build a response with the given body and ResponseUID."""
+    return (
+        f"<ClientIntegrationResponse>\n<ResponseUID>{uid}</ResponseUID>\n"
+        f"{body}\n</ClientIntegrationResponse>"
+    ).encode()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answer each request with a fixed response keyed by the request."""
+
+    responses = {
+        b"same": _response("<Value>1</Value>", "SERVER-1"),
+        b"changed": _response("<Value>new</Value>", "SERVER-2"),
+    }
+
+    def handle(self) -> None:
+        """Read the whole request and send its response."""
+        request = self.rfile.read()
+        if request == b"drop":
+            return
+        self.wfile.write(self.responses[request])
+
+
+@pytest.fixture
+def server() -> Iterator[tuple[str, int]]:
+    """A threaded TCP server standing in for SystemOne."""
+    with socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler) as tcp:
+        thread = threading.Thread(target=tcp.serve_forever, daemon=True)
+        thread.start()
+        yield tcp.server_address
+        tcp.shutdown()
+
+
+def test_normalise_masks_response_uid() -> None:
+    """Responses differing only in ResponseUID normalise to the same bytes."""
+    assert normalise_response(_response("<A/>", "ONE")) == normalise_response(
+        _response("<A/>", "TWO")
+    )
+
+
+def test_normalise_masks_epoch() -> None:
+    """The random DataExtract epoch is ignored when comparing."""
+    assert normalise_response(
+        _response("<epoch>AAA</epoch><current_version>0</current_version>", "1")
+    ) == normalise_response(
+        _response("<epoch>BBB</epoch><current_version>0</current_version>", "1")
+    )
+
+
+def test_diff_shows_changed_lines_only() -> None:
+    """The diff ignores ResponseUID and shows the changed values."""
+    diff = diff_responses(
+        _response("<Value>old</Value>", "ONE"), _response("<Value>new</Value>", "TWO")
+    )
+
+    changed = [line for line in diff.splitlines()[2:] if line.startswith(("+", "-"))]
+    assert changed == ["-<Value>old</Value>", "+<Value>new</Value>"]
+
+
+def test_replay_reports_matches_and_mismatches(
+    tmp_path: Path, server: tuple[str, int]
+) -> None:
+    """Each exchange is replayed; an empty reply counts as a mismatch."""
+    path = tmp_path / "traffic.cap"
+    writer = CaptureWriter(str(path))
+    writer.write(1.0, 0.0, b"same", _response("<Value>1</Value>", "CAPTURED-1"))
+    writer.write(2.0, 0.0, b"changed", _response("<Value>old</Value>", "CAPTURED-2"))
+    writer.write(3.0, 0.0, b"drop", _response("<Value>1</Value>", "CAPTURED-3"))
+    writer.close()
+
+    host, port = server
+    report = replay_capture(str(path), host, port, speed=0, concurrency=2)
+
+    assert report.total == 3
+    assert report.mismatches == 2
+    assert report.errors == 0
+    matched = {result.index: result.matched for result in report.results}
+    assert matched == {0: True, 1: False, 2: False}
+    assert "+<Value>new</Value>" in report.results[1].diff
+
+
+def test_replay_reports_connection_errors(tmp_path: Path) -> None:
+    """Requests that cannot be sent are counted as errors, not mismatches."""
+    path = tmp_path / "traffic.cap"
+    writer = CaptureWriter(str(path))
+    writer.write(1.0, 0.0, b"same", b"")
+    writer.close()
+
+    with socketserver.TCPServer(("127.0.0.1", 0), _Handler) as unused:
+        host, port = unused.server_address
+    report = replay_capture(str(path), host, port, speed=0, timeout=1)
+
+    assert (report.total, report.errors, report.mismatches) == (1, 1, 0)
+    assert report.results[0].error
+
+
+@pytest.mark.parametrize(("speed", "concurrency"), [(-1, 1), (1, 0)])
+def test_replay_rejects_invalid_options(speed: float, concurrency: int) -> None:
+    """Negative speeds and fewer than one connection are rejected."""
+    with pytest.raises(ValueError):
+        replay_capture("unused.cap", "127.0.0.1", 1, speed, concurrency)
@@ -0,0 +1,86 @@
+"""Tests for background loading and readiness reporting."""
+
+import json
+import logging
+import socket
+from pathlib import Path
+
+import pytest
+import systemone.main
+from systemone.main import EPRSystemOneServer
+
+REQUEST = (
+    b"<ClientIntegrationRequest><APIKey>fake-api-key</APIKey>"
+    b"<DeviceID>d</DeviceID><RequestUID>u</RequestUID>"
+    b"<Function>GetFunctions</Function></ClientIntegrationRequest>"
+)
+
+
+def _exchange(server: EPRSystemOneServer, request: bytes) -> bytes:
+    """Pass one request through the server's connection handler."""
+    client, connection = socket.socketpair()
+    with client:
+        client.sendall(request)
+        client.shutdown(socket.SHUT_WR)
+        server._handle_client(connection, ("test", 0))
+        response = b""
+        while chunk := client.recv(4096):
+            response += chunk
+    return response
+
+
+def test_ready_file_reports_health(tmp_path: Path) -> None:
+    """The ready file holds the health once loaded and goes on shutdown."""
+    ready_file = tmp_path / "systemone.ready"
+    server = EPRSystemOneServer("127.0.0.1", seed=1, ready_file=str(ready_file))
+    assert server.health()["status"] == "starting"
+
+    server._load_handler()
+
+    health = json.loads(ready_file.read_text(encoding="utf-8"))
+    assert health["status"] == "ready"
+    assert health["startup_ms"] is not None
+    server.stop_server()
+    assert not ready_file.exists()
+
+
+def test_unwritable_ready_file_is_logged(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    """A ready file that cannot be written does not stop the server."""
+    blocker = tmp_path / "state"
+    blocker.write_text("not a directory")
+    server = EPRSystemOneServer(
+        "127.0.0.1", seed=1, ready_file=str(blocker / "systemone.ready")
+    )
+
+    with caplog.at_level(logging.INFO):
+        server._load_handler()
+        server.stop_server()
+
+    assert server.ready.is_set()
+    assert "Could not write ready file" in caplog.text
+    assert "EPR System One Server ready in" in caplog.text
+    assert b"<functions>" in _exchange(server, REQUEST)
+
+
+def test_load_failure_is_reported(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Waiting clients get an error and health reports the failure."""
+
+    def fail(**kwargs: object) -> None:
+        raise MemoryError("dataset too large")
+
+    monkeypatch.setattr(systemone.main, "DataStore", fail)
+    ready_file = tmp_path / "systemone.ready"
+    server = EPRSystemOneServer("127.0.0.1", ready_file=str(ready_file))
+
+    server._load_handler()
+
+    assert server.health()["status"] == "failed"
+    assert not server.ready.is_set()
+    assert not ready_file.exists()
+    response = _exchange(server, REQUEST)
+    assert b"<Error>true</Error>" in response
+    assert b"Data failed to load: dataset too large" in response
@@ -0,0 +1,161 @@
+"""Tests for SystemOne request handling."""
+
+import xml.etree.ElementTree as ET
+
+import pytest
+from systemone.datastore import DataStore
+from systemone.systemone import SystemOne
+
+
+def _request(function: str, parameters: str = "") -> bytes:
+    """Build a request for a function."""
+    return (
+        "<ClientIntegrationRequest><APIKey>fake-api-key</APIKey>"
+        "<DeviceID>d</DeviceID><RequestUID>u</RequestUID>"
+        f"<Function>{function}</Function>"
+        f"<FunctionParameters>{parameters}</FunctionParameters>"
+        "</ClientIntegrationRequest>"
+    ).encode()
+
+
+@pytest.fixture
+def store() -> DataStore:
+    """A small seeded practice dataset."""
+    return DataStore(seed=1)
+
+
+@pytest.fixture
+def system_one(store: DataStore) -> SystemOne:
+    """A SystemOne handler over the seeded dataset."""
+    return SystemOne(store=store)
+
+
+def _response(system_one: SystemOne, function: str, parameters: str = "") -> ET.Element:
+    """Handle a request and return the parsed Response element."""
+    root = ET.fromstring(system_one.handle(_request(function, parameters)))
+    response = root.find("Response")
+    assert response is not None, ET.tostring(root)
+    return response
+
+
+def _extract(system_one: SystemOne, parameters: str) -> ET.Element:
+    """Run a PATIENTS DataExtract with extra parameters."""
+    return _response(
+        system_one,
+        "DataExtract",
+        f"<ExtractType>PATIENTS</ExtractType>{parameters}",
+    )
+
+
+def test_delta_extract_with_current_watermark(
+    system_one: SystemOne, store: DataStore
+) -> None:
+    """A watermark from this epoch returns only the changed records."""
+    watermark = _extract(system_one, "")
+    store.update_patient("P100001", {"phone": "01234 567890"})
+
+    delta = _extract(
+        system_one,
+        f"<SinceVersion>{watermark.findtext('current_version')}</SinceVersion>"
+        f"<Epoch>{watermark.findtext('epoch')}</Epoch>",
+    )
+
+    assert delta.findtext("full_resync") == "False"
+    assert delta.findtext("record_count") == "1"
+    assert delta.findtext("current_version") == "1"
+
+
+@pytest.mark.parametrize(
+    "parameters",
+    [
+        "<SinceVersion>0</SinceVersion>",
+        "<SinceVersion>0</SinceVersion><Epoch>OLD-EPOCH</Epoch>",
+        "<SinceVersion>500</SinceVersion><Epoch>{epoch}</Epoch>",
+    ],
+    ids=["missing-epoch", "other-epoch", "ahead-of-store"],
+)
+def test_untrusted_watermark_returns_full_resync(
+    system_one: SystemOne, store: DataStore, parameters: str
+) -> None:
+    """Watermarks that may predate a regeneration get the full table."""
+    store.update_patient("P100001", {"phone": "01234 567890"})
+
+    extract = _extract(system_one, parameters.format(epoch=store.epoch))
+
+    assert extract.findtext("full_resync") == "True"
+    assert extract.findtext("record_count") == str(len(store.patients))
+    assert extract.findtext("epoch") == store.epoch
+
+
+def test_invalid_since_version(system_one: SystemOne) -> None:
+    """A non-numeric SinceVersion is reported as an error."""
+    extract = _extract(system_one, "<SinceVersion>yesterday</SinceVersion>")
+
+    assert extract.findtext("error") == "Invalid SinceVersion: yesterday"
+
+
+def test_bulk_update_parses_records(system_one: SystemOne, store: DataStore) -> None:
+    """Records are parsed as a list and applied together."""
+    response = _response(
+        system_one,
+        "BulkUpdatePatientRecord",
+        "<Records>"
+        "<Record><PatientID>P100001</PatientID><phone>1</phone></Record>"
+        "<Record><PatientID>P100002</PatientID><email>a@b.c</email></Record>"
+        "</Records>",
+    )
+
+    assert response.findtext("success") == "True"
+    assert response.findtext("applied") == "2"
+    assert store.patients["P100001"]["phone"] == "1"
+    assert store.patients["P100002"]["email"] == "a@b.c"
+    assert store.version == 2
+
+
+def test_bulk_delete_rejects_item_of_another_patient(
+    system_one: SystemOne, store: DataStore
+) -> None:
+    """A mismatched PatientID and ItemID is reported and nothing deleted."""
+    owner = store.appointments["A100000"]["patient_id"]
+    other = next(patient_id for patient_id in store.patients if patient_id != owner)
+
+    response = _response(
+        system_one,
+        "BulkDeleteFromPatientRecord",
+        "<Records>"
+        f"<Record><PatientID>{owner}</PatientID><ItemType>APPOINTMENT</ItemType>"
+        "<ItemID>A100000</ItemID></Record>"
+        f"<Record><PatientID>{other}</PatientID><ItemType>APPOINTMENT</ItemType>"
+        "<ItemID>A100000</ItemID></Record>"
+        "</Records>",
+    )
+
+    assert response.findtext("success") == "False"
+    assert "NOT_FOUND" in ET.tostring(response, encoding="unicode")
+    assert "A100000" in store.appointments
+
+
+@pytest.mark.parametrize(
+    "function",
+    ["UpdatePatientRecord", "BulkUpdatePatientRecord"],
+)
+def test_nested_parameters_do_not_replace_structured_fields(
+    system_one: SystemOne, store: DataStore, function: str
+) -> None:
+    """Only Records is parsed as a list; an address element is rejected."""
+    address = dict(store.patients["P100001"]["address"])
+    record = (
+        "<PatientID>P100001</PatientID>"
+        "<address><line1>1 High Street</line1><city>Leeds</city></address>"
+    )
+    parameters = (
+        f"<Records><Record>{record}</Record></Records>"
+        if function.startswith("Bulk")
+        else record
+    )
+
+    response = _response(system_one, function, parameters)
+
+    assert response.findtext("success") == "False"
+    assert store.patients["P100001"]["address"] == address
+    assert store.version == 0
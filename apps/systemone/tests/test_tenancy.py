@@ -0,0 +1,132 @@
+"""Tests for routing requests to per-practice shards."""
+
+import json
+from pathlib import Path
+
+from systemone.tenancy import (
+    _CHANGE_LOG_ENTRY_SIZE,
+    PracticeConfig,
+    PracticeRouter,
+    generate_practices,
+    load_practices,
+)
+
+
+def _request(device_id: str, function: str, parameters: str = "") -> bytes:
+    """Build a request from a device."""
+    return (
+        "<ClientIntegrationRequest><APIKey>fake-api-key</APIKey>"
+        f"<DeviceID>{device_id}</DeviceID><RequestUID>u</RequestUID>"
+        f"<Function>{function}</Function>"
+        f"<FunctionParameters>{parameters}</FunctionParameters>"
+        "</ClientIntegrationRequest>"
+    ).encode()
+
+
+def test_generate_practices() -> None:
+    """Synthetic practices get sequential codes, seeds and device ids."""
+    practices = generate_practices(2)
+
+    assert [(p.code, p.seed, p.device_ids) for p in practices] == [
+        ("TEST001", 1, ["device-TEST001"]),
+        ("TEST002", 2, ["device-TEST002"]),
+    ]
+
+
+def test_load_practices(tmp_path: Path) -> None:
+    """Practices are read from a JSON list."""
+    path = tmp_path / "practices.json"
+    path.write_text(
+        json.dumps(
+            [{"code": "A81001", "name": "Densham", "seed": 7, "device_ids": ["d1"]}]
+        )
+    )
+
+    assert load_practices(str(path)) == [
+        PracticeConfig(code="A81001", name="Densham", seed=7, device_ids=["d1"])
+    ]
+
+
+def test_routes_by_device_id() -> None:
+    """Each device is served by its practice's dataset."""
+    router = PracticeRouter(
+        [
+            PracticeConfig("A81001", "North Surgery", 1, ["north", "north&2"]),
+            PracticeConfig("A81002", "South Surgery", 2, ["south"]),
+        ]
+    )
+
+    north = router.handle(_request("north", "GetOrganisationMetadata"))
+    escaped = router.handle(_request("north&amp;2", "GetOrganisationMetadata"))
+    south = router.handle(_request("south", "GetOrganisationMetadata"))
+
+    assert "<code>A81001</code>" in north
+    assert "<code>A81001</code>" in escaped
+    assert "<code>A81002</code>" in south
+    assert router.loaded_practices == ["A81001", "A81002"]
+
+
+def test_unknown_device_is_rejected() -> None:
+    """Requests from unmapped or missing devices get an error response."""
+    router = PracticeRouter(generate_practices(1))
+
+    assert "Unknown DeviceID: other" in router.handle(_request("other", "GetFunctions"))
+    assert "Unknown DeviceID" in router.handle(b"<ClientIntegrationRequest/>")
+    assert router.loaded_practices == []
+
+
+def test_evicts_least_recently_used_practice() -> None:
+    """Over budget, the least recently used practice is dropped first."""
+    router = PracticeRouter(generate_practices(3), memory_budget_mb=0.4)
+
+    for device in ["device-TEST001", "device-TEST002", "device-TEST001"]:
+        router.handle(_request(device, "GetOrganisationMetadata"))
+    router.handle(_request("device-TEST003", "GetOrganisationMetadata"))
+
+    assert router.loaded_practices == ["TEST001", "TEST003"]
+
+
+def test_evicted_practice_is_regenerated_from_its_seed() -> None:
+    """Changes are lost on eviction and the seeded data comes back."""
+    router = PracticeRouter(generate_practices(2), memory_budget_mb=0)
+    get_record = _request(
+        "device-TEST001", "GetPatientRecord", "<PatientID>P100001</PatientID>"
+    )
+    original = router.handle(get_record)
+    router.handle(
+        _request(
+            "device-TEST001",
+            "UpdatePatientRecord",
+            "<PatientID>P100001</PatientID><phone>changed</phone>",
+        )
+    )
+    assert "<phone>changed</phone>" in router.handle(get_record)
+
+    router.handle(_request("device-TEST002", "GetOrganisationMetadata"))
+    assert router.loaded_practices == ["TEST002"]
+
+    reloaded = router.handle(get_record)
+    assert "<phone>changed</phone>" not in reloaded
+    assert reloaded.split("<Response>")[1] == original.split("<Response>")[1]
+
+
+def test_size_grows_with_changes() -> None:
+    """Each change adds a fixed amount to the practice's estimated size."""
+    router = PracticeRouter(generate_practices(1))
+    update = _request(
+        "device-TEST001",
+        "BulkUpdatePatientRecord",
+        "<Records>"
+        "<Record><PatientID>P100001</PatientID><phone>1</phone></Record>"
+        "<Record><PatientID>P100002</PatientID><phone>2</phone></Record>"
+        "</Records>",
+    )
+    router.handle(_request("device-TEST001", "GetFunctions"))
+    shard = router._shards["TEST001"]
+    loaded_size = shard.size
+
+    router.handle(update)
+    router.handle(_request("device-TEST001", "GetFunctions"))
+
+    assert shard.size == loaded_size + 2 * _CHANGE_LOG_ENTRY_SIZE
+    assert router._total_size == shard.size
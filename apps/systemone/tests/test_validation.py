@@ -0,0 +1,141 @@
+"""Tests for XSD validation of requests and responses."""
+
+import socket
+
+import pytest
+from systemone.datastore import DataStore
+from systemone.main import EPRSystemOneServer
+from systemone.systemone import SystemOne
+from systemone.validation import MessageValidator
+
+VALID_REQUEST = (
+    b"<ClientIntegrationRequest><APIKey>fake-api-key</APIKey>"
+    b"<DeviceID>d</DeviceID><RequestUID>u</RequestUID>"
+    b"<Function>GetFunctions</Function></ClientIntegrationRequest>"
+)
+# DeviceID is required by the schema but not by the handler
+INVALID_REQUEST = (
+    b"<ClientIntegrationRequest><APIKey>fake-api-key</APIKey>"
+    b"<RequestUID>u</RequestUID>"
+    b"<Function>GetFunctions</Function></ClientIntegrationRequest>"
+)
+
+
+def test_sample_selects_every_nth_exchange() -> None:
+    """With a sample rate of N, every Nth exchange is validated."""
+    validator = MessageValidator(sample_rate=3)
+
+    assert [validator.sample() for _ in range(6)] == [
+        False,
+        False,
+        True,
+        False,
+        False,
+        True,
+    ]
+
+
+def test_rejects_invalid_sample_rate() -> None:
+    """The sample rate must be at least one."""
+    with pytest.raises(ValueError):
+        MessageValidator(sample_rate=0)
+
+
+def test_check_request_reports_schema_errors() -> None:
+    """Invalid requests and malformed XML are reported and counted."""
+    validator = MessageValidator()
+
+    assert validator.check_request(VALID_REQUEST) == []
+    errors = validator.check_request(INVALID_REQUEST)
+    malformed = validator.check_request(b"<ClientIntegrationRequest>")
+
+    assert len(errors) == 1 and "DeviceID" in errors[0]
+    assert malformed[0].startswith("Invalid XML:")
+    assert (validator.stats.requests_validated, validator.stats.requests_invalid) == (
+        3,
+        2,
+    )
+
+
+def test_handler_responses_are_valid() -> None:
+    """Responses from the SystemOne handler match the response schema."""
+    validator = MessageValidator()
+    system_one = SystemOne(store=DataStore(seed=1))
+
+    response = system_one.handle(VALID_REQUEST).encode("utf-8")
+
+    assert validator.check_response(response) == []
+    assert validator.check_response(b"<Other/>")
+    assert validator.stats.responses_invalid == 1
+
+
+def test_disabled_checks_do_nothing() -> None:
+    """Disabled request or response validation reports no errors."""
+    validator = MessageValidator(validate_requests=False, validate_responses=False)
+
+    assert validator.check_request(INVALID_REQUEST) == []
+    assert validator.check_response(b"<Other/>") == []
+    assert validator.stats.requests_validated == 0
+    assert validator.stats.responses_validated == 0
+
+
+def _exchange(server: EPRSystemOneServer, request: bytes) -> bytes:
+    """Pass one request through the server's connection handler."""
+    client, connection = socket.socketpair()
+    with client:
+        client.sendall(request)
+        client.shutdown(socket.SHUT_WR)
+        server._handle_client(connection, ("test", 0))
+        response = b""
+        while chunk := client.recv(4096):
+            response += chunk
+    return response
+
+
+def _server(validator: MessageValidator, strict: bool) -> EPRSystemOneServer:
+    """A loaded server that is not listening."""
+    server = EPRSystemOneServer(
+        "127.0.0.1",
+        store=DataStore(seed=1),
+        validator=validator,
+        validate_strict=strict,
+    )
+    server._load_handler()
+    return server
+
+
+def test_strict_mode_rejects_invalid_requests() -> None:
+    """In strict mode an invalid request gets an error, not a response."""
+    server = _server(MessageValidator(), strict=True)
+
+    rejected = _exchange(server, INVALID_REQUEST)
+    accepted = _exchange(server, VALID_REQUEST)
+
+    assert b"Request failed schema validation" in rejected
+    assert b"<Error>true</Error>" in rejected
+    assert b"<Error>" not in accepted
+    assert server.validator is not None
+    assert server.validator.stats.requests_invalid == 1
+
+
+def test_lenient_mode_handles_invalid_requests() -> None:
+    """Without strict mode invalid requests are only logged."""
+    server = _server(MessageValidator(), strict=False)
+
+    response = _exchange(server, INVALID_REQUEST)
+
+    assert b"Request failed schema validation" not in response
+    assert b"<functions>" in response
+
+
+def test_server_validates_sampled_exchanges_only() -> None:
+    """Only sampled exchanges have their request and response checked."""
+    validator = MessageValidator(sample_rate=2)
+    server = _server(validator, strict=True)
+
+    for _ in range(4):
+        _exchange(server, VALID_REQUEST)
+
+    assert validator.stats.requests_validated == 2
+    assert validator.stats.responses_validated == 2
+    assert validator.stats.responses_invalid == 0